@@ -0,0 +1,115 @@
+import pandas as pd
+
+from calendar_dim import build_calendar, calendar_keys
+from ingest import DATA_PATH, iter_sales
+
+# Monthly aggregation of the forecast inputs.
+MONTHLY_AGG = {
+    'net_units': 'sum',
+    'net_revenue': 'sum',
+    'promotion': 'mean',      # Calculate promotion proportion in a month.
+    'is_holiday': 'max',      # Label for holiday/non-holiday month.
+    'weekend': 'mean',        # Calculate weekend proportion in a month.
+    'discount_pct': 'mean'    # Calculate average discount given in a month.
+}
+
+# Mergeable partial statistics of each monthly aggregate (a mean is carried as its sum and count).
+PARTIAL_STATS = {'sum': ['sum'], 'mean': ['sum', 'count'], 'max': ['max']}
+
+def monthly(df, keys=None, cal=None):
+    # Without `keys`, this is the company-wide `df_monthly` of `forecast.py`.
+    # With `keys` (e.g. ['store_id', 'product_id']), every series is aggregated the same way in one pass.
+    # Each date is mapped to its month end through the calendar dimension (`calendar_dim.py`, built here if `cal` is None),
+    # so the grouping is on a precomputed key instead of binning every timestamp.
+    keys = list(keys or [])
+    if cal is None:
+        cal = build_calendar(df['date'].min(), df['date'].max())
+    month = calendar_keys(cal, df['date'], 'month_end')
+
+    df_monthly = df.groupby(keys + [month], observed=True).agg(MONTHLY_AGG)
+    return fill_months(df_monthly, keys).reset_index()
+
+def fill_months(df_monthly, keys):
+    # Like a monthly resample, the company-wide frame keeps the months without transactions.
+    if keys:
+        return df_monthly
+    months = pd.date_range(df_monthly.index.min(), df_monthly.index.max(), freq='ME', name='date')
+    if len(months) > len(df_monthly):
+        sums = [col for col, how in MONTHLY_AGG.items() if how == 'sum']
+        df_monthly = df_monthly.reindex(months).fillna({col: 0 for col in sums})
+    return df_monthly
+
+def monthly_partials(chunk, keys=None):
+    # Partial monthly aggregates (sum, count, max) of one chunk of rows, with plain key values
+    # so partials of chunks with different category sets line up when merged.
+    keys = list(keys or [])
+    cal = build_calendar(chunk['date'].min(), chunk['date'].max())
+    month = calendar_keys(cal, chunk['date'], 'month_end')
+    partial = (
+        chunk.groupby(keys + [month], observed=True)
+          .agg(**{f'{col}_{stat}': (col, stat) for col, how in MONTHLY_AGG.items() for stat in PARTIAL_STATS[how]})
+          .reset_index()
+    )
+    partial[keys] = partial[keys].astype(object)
+    return partial
+
+def merge_partials(partials, keys=None):
+    # Merge partial aggregates of disjoint chunks: sums and counts add up, maxima take the max.
+    keys = list(keys or [])
+    how = {f'{col}_{stat}': 'max' if stat == 'max' else 'sum'
+           for col, agg in MONTHLY_AGG.items() for stat in PARTIAL_STATS[agg]}
+    partial = pd.concat(partials, ignore_index=True).groupby(keys + ['date'], sort=True).agg(how).reset_index()
+    return partial
+
+def finalize_partials(partial, keys=None):
+    # Turn merged partials into the same frame as `monthly` on the whole data.
+    keys = list(keys or [])
+    df_monthly = partial[keys + ['date']].copy()
+    for col, how in MONTHLY_AGG.items():
+        if how == 'mean':
+            df_monthly[col] = partial[f'{col}_sum'] / partial[f'{col}_count']
+        else:
+            df_monthly[col] = partial[f'{col}_{how}']
+    df_monthly = fill_months(df_monthly.set_index(keys + ['date']), keys).reset_index()
+    return df_monthly
+
+def monthly_chunked(path=DATA_PATH, keys=None, chunksize=1_000_000, cache_dir=None):
+    # Out-of-core `monthly`: the source is streamed in chunks (see `ingest.iter_sales`) and only the
+    # small running partial aggregates are kept in memory, so the daily history never has to fit in RAM.
+    keys = list(keys or [])
+    columns = keys + ['date'] + list(MONTHLY_AGG)
+    partial, categorical = None, set()
+    for chunk in iter_sales(path, columns, chunksize, cache_dir):
+        if chunk.empty:
+            continue
+        categorical.update(col for col in keys if isinstance(chunk[col].dtype, pd.CategoricalDtype))
+        parts = [monthly_partials(chunk, keys)] if partial is None else [partial, monthly_partials(chunk, keys)]
+        partial = merge_partials(parts, keys)
+    if partial is None:
+        raise ValueError(f"No rows in '{path}'.")
+
+    df_monthly = finalize_partials(partial, keys)
+    # Categorical keys get back the (sorted) categories a full read of the source gives them.
+    for col in categorical:
+        df_monthly[col] = df_monthly[col].astype('category')
+    return df_monthly
+
+def split_series(df_monthly, keys, months=None):
+    # Split a keyed monthly frame into one frame per series, each on the same monthly calendar.
+    # Months without transactions have no sales, promotion, weekend or discount, so they are filled with 0.
+    # The holiday flag is a calendar property, so it is taken from the other series of the same month.
+    if months is None:
+        months = pd.date_range(df_monthly['date'].min(), df_monthly['date'].max(), freq='ME')
+    holiday = df_monthly.groupby('date')['is_holiday'].max().reindex(months, fill_value=0)
+    series = {}
+    for key, df_key in df_monthly.groupby(keys, observed=True, sort=True):
+        df_key = (
+            df_key.drop(columns=keys)
+              .set_index('date')
+              .reindex(months, fill_value=0)
+              .assign(is_holiday=holiday)
+              .rename_axis('date')
+              .reset_index()
+        )
+        series[key] = df_key
+    return series
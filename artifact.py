@@ -0,0 +1,144 @@
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from statsmodels.tsa.statespace.sarimax import SARIMAX, SARIMAXResults
+
+FORMAT_VERSION = 1
+
+# A compact artifact keeps only what forecasting needs:
+# the model spec, the fitted parameters, the state (and its covariance) right after the last observation and the scaler stats.
+# Data, filter output and covariance caches of the full results object are dropped.
+
+def scaler_stats(scaler):
+    stats = {
+        'feature_names': [str(col) for col in scaler.feature_names_in_],
+        'mean': np.asarray(scaler.mean_),
+        'scale': np.asarray(scaler.scale_),
+        'var': np.asarray(scaler.var_),
+        'n_samples_seen': int(scaler.n_samples_seen_)
+    }
+    return stats
+
+def restore_scaler(stats):
+    scaler = StandardScaler()
+    scaler.feature_names_in_ = np.asarray(stats['feature_names'], dtype=object)
+    scaler.n_features_in_ = len(stats['feature_names'])
+    scaler.mean_ = stats['mean']
+    scaler.scale_ = stats['scale']
+    scaler.var_ = stats['var']
+    scaler.n_samples_seen_ = stats['n_samples_seen']
+    return scaler
+
+def spec_kwargs(spec):
+    # SARIMAX keyword arguments of a stored spec.
+    return {key: spec[key] for key in [
+        'order', 'seasonal_order', 'trend', 'trend_offset', 'measurement_error',
+        'enforce_stationarity', 'enforce_invertibility'
+    ]}
+
+def to_artifact(result, scaler=None, target=None, last_period=None, updates_since_fit=0):
+    model = result.model
+
+    # The stored state only summarizes the past for time-invariant, non-pre-differenced models.
+    if model.simple_differencing or model.time_varying_regression:
+        raise ValueError('Compact artifacts require simple_differencing=False and time_varying_regression=False.')
+    # The scaler standardizes the exog columns by name, so they must be the model's exog, in the same order.
+    exog_names = list(model.exog_names or [])
+    if scaler is not None and [str(col) for col in getattr(scaler, 'feature_names_in_', [])] != exog_names:
+        raise ValueError(f'The scaler features {list(getattr(scaler, "feature_names_in_", []))} do not match the model exog {exog_names}.')
+
+    artifact = {
+        'format_version': FORMAT_VERSION,
+        'target': target,
+        'spec': {
+            'order': tuple(model.order),
+            'seasonal_order': tuple(model.seasonal_order),
+            'trend': model.trend,
+            'trend_offset': model.trend_offset + model.nobs,    # Keep time trends counting from the end of the sample.
+            'measurement_error': model.measurement_error,
+            'enforce_stationarity': model.enforce_stationarity,
+            'enforce_invertibility': model.enforce_invertibility,
+            'exog_names': exog_names
+        },
+        'nobs': int(model.nobs),
+        'params': np.asarray(result.params, dtype=float),
+        'param_names': list(result.param_names),
+        'state': np.array(result.predicted_state[:, -1]),
+        'state_cov': np.array(result.predicted_state_cov[:, :, -1]),
+        'scaler': scaler_stats(scaler) if scaler is not None else None,
+        'last_period': pd.Timestamp(last_period) if last_period is not None else None,   # Last observed month.
+        'updates_since_fit': updates_since_fit   # Months filtered in since the parameters were last estimated.
+    }
+    return artifact
+
+def save_artifact(path, result, scaler=None, target=None, last_period=None):
+    joblib.dump(to_artifact(result, scaler, target, last_period), path)
+
+def load_artifact(path):
+    artifact = joblib.load(path)
+    if artifact.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format version in '{path}': {artifact.get('format_version')}.")
+    return CompactSARIMAX(artifact)
+
+def convert_results(model_path, scaler_path=None, target=None, last_period=None):
+    # Convert a full `SARIMAXResults.save` pickle (and its `joblib` scaler) to a compact artifact.
+    result = SARIMAXResults.load(model_path)
+    scaler = joblib.load(scaler_path) if scaler_path is not None else None
+    return to_artifact(result, scaler, target, last_period)
+
+class CompactSARIMAX:
+    def __init__(self, artifact):
+        self.artifact = artifact
+        self.target = artifact['target']
+        self.spec = artifact['spec']
+        self.nobs = artifact['nobs']
+        self.params = pd.Series(artifact['params'], index=artifact['param_names'])
+        self.scaler = restore_scaler(artifact['scaler']) if artifact['scaler'] is not None else None
+        self.last_period = artifact.get('last_period')
+        self._base = np.empty(0)
+
+    @property
+    def exog_names(self):
+        return self.spec['exog_names']
+
+    @property
+    def exog_coefs(self):
+        return self.params[self.exog_names].values
+
+    def base_forecast(self, steps):
+        # The mean forecast is linear in the (scaled) exog: forecast = base_forecast + exog @ exog_coefs,
+        # where the base path is the forecast with zero exog. It does not depend on the horizon,
+        # so it is computed once and sliced (and only extended when a longer horizon is asked).
+        if len(self._base) < steps:
+            zeros = np.zeros((steps, len(self.exog_names))) if self.exog_names else None
+            self._base = np.asarray(self.get_forecast(steps, zeros).predicted_mean)
+        return self._base[:steps]
+
+    def scale(self, exog):
+        # Standardize raw exogenous values with the stored scaler stats.
+        exog = pd.DataFrame(exog)
+        if self.scaler is None:
+            return exog
+        return pd.DataFrame(self.scaler.transform(exog[self.exog_names]), index=exog.index, columns=self.exog_names)
+
+    def build(self, endog, exog=None, state=None, state_cov=None):
+        # Rebuild the state space model for the periods right after the stored state.
+        model = SARIMAX(endog=endog, exog=exog, **spec_kwargs(self.spec))
+        model.initialize_known(
+            self.artifact['state'] if state is None else state,
+            self.artifact['state_cov'] if state_cov is None else state_cov
+        )
+        return model
+
+    def get_forecast(self, steps, exog=None):
+        # With every future observation missing, the one-step predictions of the filter are the multi-step forecasts.
+        index = pd.RangeIndex(self.nobs, self.nobs + steps)
+        if exog is not None:
+            exog = np.asarray(exog, dtype=float).reshape(steps, -1)
+            exog = pd.DataFrame(exog, index=index, columns=self.exog_names)
+        model = self.build(pd.Series(np.nan, index=index), exog)
+        return model.filter(self.params.values).get_prediction()
+
+    def forecast(self, steps, exog=None):
+        return self.get_forecast(steps, exog).predicted_mean
@@ -0,0 +1,101 @@
+import argparse
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from aggregate import monthly
+from fleet import process_pool, series_frames
+from ingest import DATA_PATH, read_sales
+from model import SPECS, fit_sarimax, p_cols
+
+def score(df_bt, by):
+    # MAE and MAPE (in %) exactly as `mean_absolute_error`/`mean_absolute_percentage_error` in `forecast.py`,
+    # but vectorized over every group of a tidy backtest table.
+    eps = np.finfo(np.float64).eps
+    df_bt = df_bt.assign(
+        abs_error=(df_bt['actual'] - df_bt['forecast']).abs(),
+        ape=(df_bt['actual'] - df_bt['forecast']).abs() / df_bt['actual'].abs().clip(lower=eps)
+    )
+    df_score = df_bt.groupby(by, observed=True).agg(MAE=('abs_error', 'mean'), MAPE=('ape', 'mean')).reset_index()
+    df_score['MAPE'] *= 100
+    return df_score
+
+def run_cutoffs(key, frame, cutoffs, h, specs=SPECS):
+    # Expanding-window backtest of one series over consecutive cutoffs (number of training months).
+    # Each fit is warm-started from the parameters of the previous cutoff.
+    rows = []
+    start_params = {y_col: None for y_col in specs}
+    for cutoff in cutoffs:
+        train = frame.iloc[:cutoff]
+        test = frame.iloc[cutoff:cutoff + h]
+
+        # Scale the exogenous variables on the training window only, like in `forecast.py`.
+        scaler = StandardScaler()
+        X_train = scaler.fit_transform(train[p_cols])
+        X_test = scaler.transform(test[p_cols])
+
+        for y_col, spec in specs.items():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                result = fit_sarimax(train[y_col], X_train, spec['order'], spec['seasonal_order'], start_params[y_col])
+            start_params[y_col] = result.params
+            pred = np.expm1(result.get_forecast(steps=len(test), exog=X_test).predicted_mean)
+            rows.append(pd.DataFrame({
+                'key': [key] * len(test),
+                'target': y_col,
+                'cutoff': train['date'].iloc[-1],
+                'step': np.arange(1, len(test) + 1),
+                'date': test['date'].values,
+                'actual': test[y_col].values,
+                'forecast': np.asarray(pred),
+                'converged': bool(result.mle_retvals.get('converged', False))
+            }))
+    return pd.concat(rows, ignore_index=True)
+
+def backtest(frames, h=6, min_train=24, step=1, n_jobs=None, specs=SPECS):
+    # Rolling-origin (expanding window) backtest.
+    # `frames` is a monthly frame (e.g. `df_monthly`) or a dict of them (e.g. from `fleet.series_frames`).
+    # Returns the tidy forecast table (one row per series, target, cutoff and horizon step).
+    if isinstance(frames, pd.DataFrame):
+        frames = {'total': frames}
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    # Warm starts chain the cutoffs of a series, so each series is split into contiguous blocks of cutoffs,
+    # just enough blocks to keep every worker busy. Each block is then run sequentially in one worker.
+    n_blocks = max(1, -(-n_jobs // len(frames)))
+    tasks = []
+    for key, frame in frames.items():
+        cutoffs = np.arange(min_train, len(frame), step)
+        for block in np.array_split(cutoffs, min(n_blocks, len(cutoffs))):
+            if len(block):
+                tasks.append((key, frame, block, h, specs))
+
+    if n_jobs == 1:
+        results = [run_cutoffs(*task) for task in tasks]
+    else:
+        with process_pool(n_jobs) as pool:
+            results = list(pool.map(run_cutoffs, *zip(*tasks)))
+
+    if not results:
+        raise ValueError(f'No cutoffs to backtest; every series needs more than {min_train} months.')
+    df_bt = pd.concat(results, ignore_index=True)
+    return df_bt.sort_values(['key', 'target', 'cutoff', 'step']).reset_index(drop=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rolling-origin backtest of the SARIMAX models.')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--fleet', action='store_true', help='Backtest every store/product series instead of the company-wide series.')
+    parser.add_argument('--horizon', type=int, default=6)
+    parser.add_argument('--min-train', type=int, default=24)
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--out', default='backtest.csv')
+    args = parser.parse_args()
+
+    df = read_sales(args.data)
+    frames = series_frames(df) if args.fleet else monthly(df)
+    df_bt = backtest(frames, args.horizon, args.min_train, n_jobs=args.jobs)
+    df_bt.to_csv(args.out, index=False)
+    print(score(df_bt, ['target', 'step']))
@@ -0,0 +1,135 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from aggregate import monthly
+from ingest import DATA_PATH, read_sales
+from model import y_cols
+
+# Baseline forecasts of a whole panel of monthly series at once: seasonal naive, drift and simple exponential
+# smoothing (SES). A panel is a 2-D array (series x months), and every method works on all of its rows together:
+# the only Python loops run over months, cutoffs or smoothing weights, never over series.
+# Scored on the same cutoffs as `backtest.py`, they show which SARIMAX fits do worse than a naive forecast.
+METHODS = ['seasonal_naive', 'drift', 'ses']
+SEASON = 12
+ALPHAS = np.linspace(0.05, 1, 20)     # Grid of SES smoothing weights; the best one is picked per series.
+
+def panel(df_monthly, y_col, keys=None):
+    # (series x months) array of a monthly frame and the key of each row.
+    # With `keys` (e.g. `monthly(df, keys)`), months without transactions are 0, like in `aggregate.split_series`.
+    if not keys:
+        return ['total'], df_monthly[y_col].to_numpy(dtype=float)[None, :]
+    months = pd.date_range(df_monthly['date'].min(), df_monthly['date'].max(), freq='ME')
+    wide = (
+        df_monthly.set_index(keys + ['date'])[y_col]
+          .unstack('date', fill_value=0)
+          .reindex(columns=months, fill_value=0)
+    )
+    # Tuple keys even for a single key column, like the series of `aggregate.split_series`.
+    index = pd.MultiIndex.from_arrays([wide.index.get_level_values(k) for k in keys])
+    return list(index), wide.to_numpy(dtype=float)
+
+def seasonal_naive(Y, h, season=SEASON):
+    # Each month repeats the same month of the last observed season.
+    if Y.shape[1] < season:
+        raise ValueError(f'Seasonal naive needs at least {season} months.')
+    return Y[:, -season:][:, np.arange(h) % season]
+
+def drift(Y, h):
+    # The last value, moved along the average change over the history.
+    slope = (Y[:, -1] - Y[:, 0]) / max(Y.shape[1] - 1, 1)
+    return Y[:, -1:] + slope[:, None] * np.arange(1, h + 1)
+
+def ses_levels(Y, cutoffs, alphas=ALPHAS):
+    # Smoothed level of every series after each cutoff (series x cutoffs). The level is filtered for every smoothing
+    # weight at once (series x alphas) and each series keeps the weight with the smallest in-sample one-step squared
+    # error up to the cutoff. The history before a cutoff is a prefix of the one before the next, so a single
+    # filtering pass serves every cutoff.
+    levels = np.empty((len(Y), len(cutoffs)))
+    level = np.repeat(Y[:, :1], len(alphas), axis=1)
+    sse = np.zeros_like(level)
+    for t in range(1, max(cutoffs) + 1):
+        for i in np.flatnonzero(np.asarray(cutoffs) == t):
+            levels[:, i] = level[np.arange(len(Y)), sse.argmin(axis=1)]
+        if t < max(cutoffs):
+            error = Y[:, t, None] - level
+            sse += error ** 2
+            level += alphas * error
+    return levels
+
+def ses(Y, h, alphas=ALPHAS):
+    # Flat forecast at the smoothed level.
+    return np.repeat(ses_levels(Y, [Y.shape[1]], alphas), h, axis=1)
+
+FORECASTERS = {'seasonal_naive': seasonal_naive, 'drift': drift, 'ses': ses}
+
+def forecast(Y, h, methods=METHODS):
+    # {method: (series x h) forecasts} after the last month of `Y`.
+    return {method: FORECASTERS[method](Y, h) for method in methods}
+
+def errors(actual, pred):
+    # Mean absolute and absolute percentage (in %) errors of every row, exactly as `backtest.score`
+    # (and so as `mean_absolute_error`/`mean_absolute_percentage_error` in `forecast.py`). NaN cells are skipped.
+    eps = np.finfo(np.float64).eps
+    abs_error = np.abs(actual - pred)
+    mae = np.nanmean(abs_error, axis=1)
+    mape = np.nanmean(abs_error / np.clip(np.abs(actual), eps, None), axis=1) * 100
+    return mae, mape
+
+def baseline_scores(Y, h=6, cutoffs=None, methods=METHODS):
+    # MAE and MAPE of every series and method, over the forecasts of `h` months after each cutoff
+    # (number of training months, as in `backtest.backtest`; the last `h` months by default).
+    # Windows that run past the data are shorter, like in the backtest.
+    n_series, n_months = Y.shape
+    cutoffs = [n_months - h] if cutoffs is None else list(cutoffs)
+    actual = np.full((n_series, len(cutoffs), h), np.nan)
+    preds = {method: np.empty_like(actual) for method in methods}
+    for i, cutoff in enumerate(cutoffs):
+        window = Y[:, cutoff:cutoff + h]
+        actual[:, i, :window.shape[1]] = window
+        for method, pred in forecast(Y[:, :cutoff], h, [m for m in methods if m != 'ses']).items():
+            preds[method][:, i] = pred
+    if 'ses' in methods:
+        preds['ses'][:] = ses_levels(Y, cutoffs)[:, :, None]
+
+    actual = actual.reshape(n_series, -1)
+    scores = {}
+    for method, pred in preds.items():
+        scores[method] = errors(actual, pred.reshape(n_series, -1))
+    return scores
+
+def score_baselines(df_monthly, targets=y_cols, keys=None, h=6, cutoffs=None, methods=METHODS):
+    # Tidy MAE/MAPE table (one row per series, target and method) of a monthly frame (e.g. `df_monthly`, or
+    # `monthly(df, keys)` with its `keys`). Its `key` and `target` match the `backtest.score(df_bt, ['key', 'target'])`
+    # table of the same series, so both can be passed to `worse_than_baseline`.
+    tables = []
+    for y_col in targets:
+        index, Y = panel(df_monthly, y_col, keys)
+        for method, (mae, mape) in baseline_scores(Y, h, cutoffs, methods).items():
+            tables.append(pd.DataFrame({'key': index, 'target': y_col, 'method': method, 'MAE': mae, 'MAPE': mape}))
+    return pd.concat(tables, ignore_index=True)
+
+def worse_than_baseline(df_score, df_baseline, metric='MAPE'):
+    # Series and targets whose model score (e.g. `backtest.score(df_bt, ['key', 'target'])`) is worse than
+    # their best baseline, with the name and score of that baseline.
+    best = df_baseline.loc[df_baseline.groupby(['key', 'target'])[metric].idxmin(), ['key', 'target', 'method', metric]]
+    df_cmp = df_score[['key', 'target', metric]].merge(best, on=['key', 'target'], suffixes=('', '_baseline'))
+    df_cmp = df_cmp.rename(columns={'method': 'baseline'})
+    return df_cmp[df_cmp[metric] > df_cmp[f'{metric}_baseline']].reset_index(drop=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seasonal naive, drift and SES baseline scores of every series.')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--keys', nargs='*', default=None, help='Series keys (e.g. store_id product_id); company-wide series by default.')
+    parser.add_argument('--horizon', type=int, default=6)
+    parser.add_argument('--min-train', type=int, default=None, help='Score every cutoff from this many months on, like `backtest.py` (default: last horizon only).')
+    parser.add_argument('--out', default='baselines.csv')
+    args = parser.parse_args()
+
+    df_monthly = monthly(read_sales(args.data), args.keys)
+    n_months = len(pd.date_range(df_monthly['date'].min(), df_monthly['date'].max(), freq='ME'))
+    cutoffs = None if args.min_train is None else range(args.min_train, n_months)
+    df_baseline = score_baselines(df_monthly, keys=args.keys, h=args.horizon, cutoffs=cutoffs)
+    df_baseline.to_csv(args.out, index=False)
+    print(df_baseline.groupby(['target', 'method'])[['MAE', 'MAPE']].median())
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from aggregate import monthly, monthly_chunked
+from artifact import load_artifact, save_artifact
+from calendar_dim import calendar_keys, sales_calendar
+from cube import SalesCube
+from helper import avg_dfitem, binary_effects, binary_mean_diff, df_base_diff, dfs_to_df, partition, separate, series_group
+from ingest import DATA_PATH, read_sales
+from model import SPECS, fit_sarimax, p_cols
+
+# Benchmark suite of the hot paths: helper functions, monthly aggregation and SARIMAX fit/forecast/save/load.
+# Data-bound benchmarks run on the sample scaled to several row counts (and optionally store counts),
+# each result is the time of several repeats and the peak traced memory of one more run, and results are
+# written to JSON so a later run can be compared against them (`--compare`) to flag regressions.
+SCALES = [1, 10]    # Multiples of the sample row count (add e.g. 100 1000 on machines with the memory for them).
+REPEAT = 3
+TOLERANCE = 0.2     # Relative slowdown (or memory growth) flagged as a regression.
+NOISE_FLOOR = 1e-3  # Timings below a millisecond are too noisy to compare.
+
+def scaled_sales(df, factor=1, n_stores=None):
+    # `factor` copies of the sample rows. Each copy gets its own stores, so the number of series grows with the rows;
+    # with `n_stores`, the rows are spread over that many stores instead.
+    codes, _ = pd.factorize(df['store_id'], sort=True)
+    n_sample = codes.max() + 1
+    df_scaled = df.take(np.tile(np.arange(len(df)), factor)).reset_index(drop=True)
+    stores = np.tile(codes, factor) + np.repeat(np.arange(factor), len(df)) * n_sample
+    if n_stores:
+        stores = np.random.default_rng(0).integers(0, n_stores, len(df_scaled))
+    n_stores = n_stores or n_sample * factor
+    df_scaled['store_id'] = pd.Categorical.from_codes(stores, [f'store_{i:05d}' for i in range(n_stores)])
+    return df_scaled
+
+# Each setup prepares the inputs of one benchmark (untimed) and returns the call to time.
+# Data-bound setups take the scaled sales frame; the model setups take the monthly frame.
+
+def setup_partition(df):
+    return lambda: partition(df, 'store_id')
+
+def setup_separate(df):
+    return lambda: separate(df, {}, 'store_id')
+
+def setup_binary_mean_diff(df):
+    daily = df.groupby(['store_id', 'date'], observed=True).agg({'is_holiday': 'max', 'net_units': 'sum', 'net_revenue': 'sum'})
+    return lambda: binary_mean_diff(daily, 'is_holiday', 'both')
+
+def setup_binary_effects(df):
+    means = df.groupby(['store_id', 'product_id', 'promotion'], observed=True)[['net_units', 'net_revenue']].mean().reset_index()
+    return lambda: binary_effects(means, 'store_id', 'promotion', ['net_units', 'net_revenue'])
+
+def product_discount_means(df):
+    means = df.groupby(['store_id', 'discount_pct'], observed=True)[['net_units', 'net_revenue']].mean()
+    return {store: df_disc.droplevel(0) for store, df_disc in means.groupby(level=0, observed=True)}
+
+def setup_df_base_diff(df):
+    dfs = product_discount_means(df)
+    return lambda: [df_base_diff(df_disc) for df_disc in dfs.values()]
+
+def setup_avg_dfitem(df):
+    dfs = {store: df_base_diff(df_disc) for store, df_disc in product_discount_means(df).items()}
+    return lambda: avg_dfitem(dfs, dispersion=True)
+
+def setup_dfs_to_df(df):
+    dfs = product_discount_means(df)
+    return lambda: dfs_to_df(dict(dfs), 'store_id', index_name='discount_pct')
+
+def setup_series_group(df):
+    cal = sales_calendar(df)
+    df_month = df[['store_id', 'category', 'net_units']].assign(date=calendar_keys(cal, df['date'], 'month'))
+    df_month = df_month.groupby(['store_id', 'date', 'category'], observed=True)['net_units'].sum().reset_index()
+    df_leaders = df_month.loc[df_month.groupby(['store_id', 'date'], observed=True)['net_units'].idxmax()]
+    return lambda: series_group(df_leaders, 'category', 'net_units', by='store_id')
+
+def setup_calendar_keys(df):
+    # Replaces the former string-based `helper.dtm` month keys.
+    cal = sales_calendar(df)
+    return lambda: calendar_keys(cal, df['date'], 'month')
+
+def setup_monthly(df):
+    return lambda: monthly(df)
+
+def setup_monthly_by_series(df):
+    return lambda: monthly(df, ['store_id', 'product_id'])
+
+def setup_monthly_chunked(df):
+    # Out-of-core path on the same rows written to a temporary CSV.
+    path = os.path.join(tempfile.mkdtemp(), 'sales.csv')
+    df.to_csv(path, index=False)
+    return lambda: monthly_chunked(path, chunksize=max(len(df) // 4, 1))
+
+def setup_cube_build(df):
+    cal = sales_calendar(df)
+    return lambda: SalesCube.build(df, cal)
+
+def fit_inputs(df_monthly, y_col):
+    X = pd.DataFrame(StandardScaler().fit_transform(df_monthly[p_cols]), columns=p_cols)
+    return df_monthly[y_col], X
+
+def fit_quiet(y, X, spec):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return fit_sarimax(y, X, spec['order'], spec['seasonal_order'])
+
+def setup_sarimax_fit(df_monthly):
+    inputs = {y_col: fit_inputs(df_monthly, y_col) for y_col in SPECS}
+    return lambda: [fit_quiet(y, X, SPECS[y_col]) for y_col, (y, X) in inputs.items()]
+
+def setup_sarimax_forecast(df_monthly, h=6):
+    fits = {y_col: fit_quiet(*fit_inputs(df_monthly.iloc[:-h], y_col), SPECS[y_col]) for y_col in SPECS}
+    X_future = np.zeros((h, len(p_cols)))
+    return lambda: [result.get_forecast(steps=h, exog=X_future).predicted_mean for result in fits.values()]
+
+def setup_sarimax_save(df_monthly):
+    fits = {y_col: fit_quiet(*fit_inputs(df_monthly, y_col), SPECS[y_col]) for y_col in SPECS}
+    out_dir = tempfile.mkdtemp()
+    return lambda: [save_artifact(os.path.join(out_dir, f'model_{y_col}.joblib'), result, target=y_col) for y_col, result in fits.items()]
+
+def setup_sarimax_load(df_monthly):
+    out_dir = tempfile.mkdtemp()
+    for y_col in SPECS:
+        save_artifact(os.path.join(out_dir, f'model_{y_col}.joblib'), fit_quiet(*fit_inputs(df_monthly, y_col), SPECS[y_col]), target=y_col)
+    return lambda: [load_artifact(os.path.join(out_dir, f'model_{y_col}.joblib')).forecast(6, np.zeros((6, len(p_cols)))) for y_col in SPECS]
+
+# name -> setup; data-bound benchmarks run at every scale, model benchmarks once on the sample's monthly frame.
+DATA_BENCHMARKS = {
+    'helper.partition': setup_partition,
+    'helper.separate': setup_separate,
+    'helper.binary_mean_diff': setup_binary_mean_diff,
+    'helper.binary_effects': setup_binary_effects,
+    'helper.df_base_diff': setup_df_base_diff,
+    'helper.avg_dfitem': setup_avg_dfitem,
+    'helper.dfs_to_df': setup_dfs_to_df,
+    'helper.series_group': setup_series_group,
+    'calendar_dim.calendar_keys': setup_calendar_keys,
+    'aggregate.monthly': setup_monthly,
+    'aggregate.monthly_by_series': setup_monthly_by_series,
+    'aggregate.monthly_chunked': setup_monthly_chunked,
+    'cube.build': setup_cube_build
+}
+MODEL_BENCHMARKS = {
+    'sarimax.fit': setup_sarimax_fit,
+    'sarimax.forecast': setup_sarimax_forecast,
+    'sarimax.save': setup_sarimax_save,
+    'sarimax.load_forecast': setup_sarimax_load
+}
+
+def measure(call, repeat=REPEAT):
+    # Wall times of `repeat` runs, then the peak memory traced during one more run (tracing slows it, so it is not timed).
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'min_s': min(times), 'median_s': float(np.median(times)), 'peak_mb': peak / 2**20}
+
+def run_benchmarks(df, scales=SCALES, entities=(None,), repeat=REPEAT, only=None):
+    selected = lambda name: not only or any(name.startswith(prefix) for prefix in only)
+    results = []
+    for scale in scales:
+        for n_stores in entities:
+            df_scaled = scaled_sales(df, scale, n_stores)
+            n_series = df_scaled['store_id'].nunique()
+            for name, setup in DATA_BENCHMARKS.items():
+                if selected(name):
+                    stats = measure(setup(df_scaled), repeat)
+                    results.append({'benchmark': name, 'scale': scale, 'rows': len(df_scaled), 'stores': n_series, **stats})
+                    print(f"{name:<30} x{scale:<5} {n_series:>6} stores  {stats['median_s']:9.4f}s  {stats['peak_mb']:9.1f} MB")
+            del df_scaled
+
+    df_monthly = monthly(df)
+    for name, setup in MODEL_BENCHMARKS.items():
+        if selected(name):
+            stats = measure(setup(df_monthly), repeat)
+            results.append({'benchmark': name, 'scale': 1, 'rows': len(df_monthly), 'stores': None, **stats})
+            print(f"{name:<30} {'':<6} {'':>13}  {stats['median_s']:9.4f}s  {stats['peak_mb']:9.1f} MB")
+    return results
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': pd.Timestamp.now().isoformat(timespec='seconds')
+    }
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    # Median time and peak memory of every benchmark relative to the baseline run of the same size.
+    keys = ['benchmark', 'scale', 'stores']
+    current = pd.DataFrame(results)
+    base = pd.DataFrame(baseline)[keys + ['median_s', 'peak_mb']]
+    df_cmp = current.merge(base, on=keys, how='inner', suffixes=('', '_base'))
+    df_cmp['time_ratio'] = df_cmp['median_s'] / df_cmp['median_s_base']
+    df_cmp['memory_ratio'] = df_cmp['peak_mb'] / df_cmp['peak_mb_base']
+    slower = (df_cmp['time_ratio'] > 1 + tolerance) & (df_cmp['median_s'] - df_cmp['median_s_base'] > NOISE_FLOOR)
+    bigger = df_cmp['memory_ratio'] > 1 + tolerance
+    df_cmp['regression'] = np.select([slower & bigger, slower, bigger], ['time+memory', 'time', 'memory'], '')
+    return df_cmp[keys + ['median_s_base', 'median_s', 'time_ratio', 'peak_mb_base', 'peak_mb', 'memory_ratio', 'regression']]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time and memory-profile the helper functions, monthly aggregation and SARIMAX models.')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES, help='Multiples of the sample row count, e.g. 1 10 100 1000.')
+    parser.add_argument('--stores', type=int, nargs='+', default=None, help='Store counts to spread the scaled rows over (default: stores grow with the scale).')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--only', nargs='+', default=None, help='Benchmark name prefixes to run, e.g. helper. sarimax.fit')
+    parser.add_argument('--out', default='./bench_results.json')
+    parser.add_argument('--compare', default=None, help='Baseline results JSON to flag regressions against.')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_benchmarks(read_sales(args.data), args.scales, args.stores or [None], args.repeat, args.only)
+    with open(args.out + '.tmp', 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=1)
+    os.replace(args.out + '.tmp', args.out)
+    print(f'Results written to {args.out}.')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        df_cmp = compare(results, baseline['results'], args.tolerance)
+        with pd.option_context('display.width', 200, 'display.max_rows', None):
+            print(df_cmp.round(4).to_string(index=False))
+        regressions = df_cmp[df_cmp['regression'] != '']
+        if len(regressions):
+            print(f'{len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline.')
+            sys.exit(1)
+        print('No regressions.')
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+# Calendar dimension: one row per day of a date range with the keys the analyses group and join on.
+# It is built once per date range and transaction dates are mapped to it by their day offset,
+# so month/week/day keys are never derived row by row (e.g. by casting dates to strings).
+# `day_of_week` follows the data: 0 = Monday, ..., 6 = Sunday.
+
+def build_calendar(start, end, holidays=()):
+    days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D', name='date')
+    iso = days.isocalendar()
+    cal = pd.DataFrame({
+        'date': days,
+        'month_id': days.to_period('M').asi8,                   # Integer month code (months since 1970-01).
+        'month': days.to_period('M'),                           # Same code as a monthly period (prints as YYYY-MM).
+        'month_end': days + pd.offsets.MonthEnd(0),             # Month label of the forecast frames.
+        'iso_year': iso['year'].to_numpy(dtype='int16'),
+        'iso_week': iso['week'].to_numpy(dtype='int8'),
+        'week_id': (iso['year'] * 100 + iso['week']).to_numpy(dtype='int32'),    # e.g. 202401.
+        'day_of_week': days.dayofweek.to_numpy(dtype='int8'),
+        'weekend': (days.dayofweek >= 5).astype('int8'),
+        'is_holiday': days.isin(pd.DatetimeIndex(holidays).normalize()).astype('int8')
+    })
+    return cal
+
+def sales_calendar(df):
+    # Calendar covering a sales frame, with the holidays flagged in its data.
+    holidays = df.loc[df['is_holiday'] == 1, 'date'].unique()
+    return build_calendar(df['date'].min(), df['date'].max(), holidays)
+
+def day_positions(cal, dates):
+    # Calendar row of each date: its day offset from the first calendar day.
+    days = np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[D]')
+    pos = (days - cal['date'].iloc[0].to_datetime64().astype('datetime64[D]')).astype(np.int64)
+    if len(pos) and (pos.min() < 0 or pos.max() >= len(cal)):
+        raise ValueError('Some dates fall outside the calendar range.')
+    return pos
+
+def calendar_keys(cal, dates, columns):
+    # Calendar attributes (one column name or a list) of each date.
+    # The result is aligned with `dates`: a Series keeps its index and name, an Index stays an Index.
+    pos = day_positions(cal, dates)
+    if isinstance(columns, str):
+        values = cal[columns].array.take(pos)
+        if isinstance(dates, pd.Index):
+            return pd.Index(values, name=dates.name)
+        index = dates.index if isinstance(dates, pd.Series) else None
+        return pd.Series(values, index=index, name=getattr(dates, 'name', columns))
+
+    keys = cal[list(columns)].take(pos)
+    keys.index = dates.index if isinstance(dates, pd.Series) else pd.RangeIndex(len(pos))
+    return keys
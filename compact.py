@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+# Memory-compact frames: labels as categoricals, integers in the narrowest type that holds their range
+# and floats as float32 when every value survives the round trip at the column's decimal precision
+# (e.g. prices and ratings with 2 decimals). Columns that are already compact are shared, not copied.
+INT_TYPES = [np.int8, np.int16, np.int32, np.int64]     # Signed, so differences (e.g. units - returns) stay safe.
+MAX_DECIMALS = 6
+
+def narrowest_int(values):
+    if len(values) == 0:
+        return values.dtype
+    lo, hi = values.min(), values.max()
+    return next(t for t in INT_TYPES if np.iinfo(t).min <= lo and hi <= np.iinfo(t).max)
+
+def decimals(values):
+    # Number of decimals of the values (None if they have more than MAX_DECIMALS, e.g. computed ratios).
+    finite = values[np.isfinite(values)]
+    return next((d for d in range(MAX_DECIMALS + 1) if np.array_equal(np.round(finite, d), finite)), None)
+
+def float32_safe(values):
+    d = decimals(values)
+    if d is None:
+        return False
+    finite = values[np.isfinite(values)]
+    return np.array_equal(np.round(finite.astype(np.float32).astype(np.float64), d), finite)
+
+def widen(col):
+    # float64 values of a float32 column of `compact`: the shortest decimals that give back its values,
+    # i.e. exactly the float64 values it was compacted from (not their float32 approximations, e.g. 447.839996).
+    values = col.to_numpy()
+    if values.dtype != np.float32:
+        return col.astype(np.float64)
+    wide = values.astype(np.float64)
+    for d in range(MAX_DECIMALS + 1):
+        rounded = np.round(wide, d)
+        if np.array_equal(rounded.astype(np.float32), values, equal_nan=True):
+            return pd.Series(rounded, index=col.index, name=col.name)
+    return pd.Series(wide, index=col.index, name=col.name)
+
+def compact_column(col, max_category_ratio=0.5, float32=True):
+    # Compact dtype of a column (None if it is already compact).
+    dtype = col.dtype
+    if dtype == object or isinstance(dtype, pd.StringDtype):
+        return 'category' if col.nunique() <= max_category_ratio * len(col) else None
+    if pd.api.types.is_bool_dtype(dtype) or not isinstance(dtype, np.dtype):
+        return None     # Bool, categorical, datetime with time zone, ...
+    values = col.to_numpy()
+    if dtype.kind in 'iu':
+        narrow = narrowest_int(values)
+        return narrow if np.dtype(narrow).itemsize < dtype.itemsize else None
+    if dtype.kind == 'f' and float32 and dtype.itemsize > 4 and float32_safe(values):
+        return np.float32
+    return None
+
+def compact(df, max_category_ratio=0.5, float32=True):
+    # Compact copy of `df` in which only the converted columns take new memory.
+    columns = {}
+    for name, col in df.items():
+        dtype = compact_column(col, max_category_ratio, float32)
+        columns[name] = col if dtype is None else col.astype(dtype)
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+def memory_report(before, after):
+    # Memory of each column (deep, in MB) before and after compaction, with a total row.
+    mb_before = before.memory_usage(deep=True, index=False) / 2**20
+    mb_after = after.memory_usage(deep=True, index=False) / 2**20
+    df_report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'dtype_after': after.dtypes.astype(str),
+        'mb_before': mb_before,
+        'mb_after': mb_after
+    })
+    df_report.loc['total'] = ['', '', mb_before.sum(), mb_after.sum()]
+    df_report['saved_pct'] = (1 - df_report['mb_after'] / df_report['mb_before']) * 100
+    return df_report
@@ -0,0 +1,79 @@
+import os
+
+import pandas as pd
+
+from calendar_dim import calendar_keys, sales_calendar
+from compact import widen
+
+# Aggregate cube of the sales data at date x store x product x promotion x discount level x online grain.
+# Its measures are additive (sums and non-null counts), so every coarser question is answered by rolling it up:
+# sums add up and a mean is the rolled-up sum over the rolled-up count, exactly like a mean over the raw rows.
+# The discount levels of the data are a few discrete percentages, so they are kept as is (coarser bands roll up from them).
+# Store, product and calendar attributes (e.g. city, category, is_holiday) live in small dimension tables
+# and are only looked up when a rollup groups by them.
+CUBE_KEYS = ['date', 'store_id', 'product_id', 'promotion', 'discount_pct', 'online']
+CUBE_MEASURES = ['net_units', 'net_revenue', 'returns', 'avg_rating']
+STORE_ATTRS = ['store_type', 'region', 'city', 'store_area_sqft']
+PRODUCT_ATTRS = ['category']
+
+class SalesCube:
+    def __init__(self, facts, stores, products, cal):
+        self.facts = facts          # Cube cells: keys, measure sums and `<measure>_count`.
+        self.stores = stores        # Store attributes, indexed by store_id.
+        self.products = products    # Product attributes, indexed by product_id.
+        self.cal = cal              # Calendar dimension (see `calendar_dim.py`).
+
+    @classmethod
+    def build(cls, df, cal=None):
+        # The only pass over the raw rows.
+        # Measures are accumulated in 64 bits whatever their storage type (e.g. float32/int8 after `compact.compact`).
+        wide = {m: widen(df[m]) if df[m].dtype.kind == 'f' else df[m].astype('int64') for m in CUBE_MEASURES}
+        facts = (
+            df[CUBE_KEYS].assign(**wide).groupby(CUBE_KEYS, observed=True)
+              .agg(**{name: (m, stat) for m in CUBE_MEASURES for name, stat in [(m, 'sum'), (f'{m}_count', 'count')]})
+              .reset_index()
+        )
+        stores = df[['store_id'] + STORE_ATTRS].drop_duplicates('store_id').set_index('store_id').sort_index()
+        products = df[['product_id'] + PRODUCT_ATTRS].drop_duplicates('product_id').set_index('product_id').sort_index()
+        cal = sales_calendar(df) if cal is None else cal
+        return cls(facts, stores, products, cal)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name, table in [('facts', self.facts), ('stores', self.stores), ('products', self.products), ('calendar', self.cal)]:
+            table.to_parquet(os.path.join(path, f'{name}.parquet'))
+
+    @classmethod
+    def load(cls, path):
+        tables = [pd.read_parquet(os.path.join(path, f'{name}.parquet')) for name in ['facts', 'stores', 'products', 'calendar']]
+        return cls(*tables)
+
+    def attribute(self, name):
+        # A dimension attribute of every cube cell.
+        if name in self.stores.columns:
+            values = self.stores[name].reindex(self.facts['store_id']).array
+        elif name in self.products.columns:
+            values = self.products[name].reindex(self.facts['product_id']).array
+        elif name in self.cal.columns:
+            values = calendar_keys(self.cal, self.facts['date'], name).array
+        else:
+            raise KeyError(f"'{name}' is neither a cube column nor a store, product or calendar attribute.")
+        return pd.Series(values, index=self.facts.index, name=name)
+
+    def rollup(self, by, measures=None, how='sum'):
+        # Roll the cube up to `by`: cube keys, dimension attributes or Series aligned with `facts` (e.g. derived bands).
+        # how='sum' gives the totals, how='mean' the means over the raw rows and how='count' the raw row counts.
+        by = by if isinstance(by, list) else [by]
+        measures = [measures] if isinstance(measures, str) else list(measures or CUBE_MEASURES)
+        keys = [col if isinstance(col, pd.Series) or col in self.facts.columns else self.attribute(col) for col in by]
+        counts = [f'{m}_count' for m in measures]
+
+        totals = self.facts.groupby(keys, observed=True)[measures + counts].sum()
+        if how == 'sum':
+            return totals[measures]
+        if how == 'count':
+            return totals[counts].set_axis(measures, axis=1)
+        if how == 'mean':
+            means = totals[measures].to_numpy(dtype=float) / totals[counts].to_numpy()
+            return pd.DataFrame(means, index=totals.index, columns=measures)
+        raise ValueError(f"Unknown rollup '{how}'; use 'sum', 'mean' or 'count'.")
@@ -8,11 +8,19 @@ importlib.reload(helper)
 
 # %%
 from helper import *
+from calendar_dim import calendar_keys, sales_calendar
+from compact import compact, memory_report
+from cube import SalesCube
+from ingest import read_sales
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 
+# Copy-on-write: frames derived from one another share their data until one of them is modified,
+# so no section needs a defensive deep copy.
+pd.set_option('mode.copy_on_write', True)
+
 # %% [markdown]
 # # Data Preprocessing
 
@@ -20,8 +28,21 @@ import matplotlib.colors as mcolors
 # Read the raw data file.
 
 # %%
-raw_df = pd.read_csv('./data/retail_sales_synthetic.csv')
-df = raw_df.copy()  # Copy to ensure every change made in this code doesn't affect the raw data.
+# The CSV is parsed once with an explicit schema and reused from its Parquet cache until the file changes.
+raw_df = read_sales('./data/retail_sales_synthetic.csv')
+# Compact dtypes (narrowest integers, float32 where the values' decimals allow it); the raw data is left unchanged
+# and the columns that are already compact (categorical labels, int8 flags, dates) are shared instead of copied.
+df = compact(raw_df)
+# Calendar dimension of the data's date range: month, ISO week, day-of-week, weekend and holiday keys of every day.
+cal = sales_calendar(df)
+# Aggregate cube (date x store x product x promotion x discount x online) with additive measures.
+# Every section below rolls it up instead of scanning the raw rows again.
+cube = SalesCube.build(df, cal)
+
+# %%
+# Memory of each column before and after compaction.
+print('\nMemory Report (MB):')
+print(memory_report(raw_df, df).round(3))
 
 # %%
 # df.head()/df.describe() truncates columns.
@@ -53,15 +74,6 @@ print(df.describe().iloc[:, int(n_col/3):])
 # %% [markdown]
 # ## 1. Does the presence of holiday affect overall sales and revenue, both daily and monthly?
 
-# %% [markdown]
-# Get the necessary columns from the preprocessed data.
-
-# %%
-# Each row is confirmed unique from the previous step so we can exclude the ID columns in this section.
-# Copy to ensure every change made in this section doesn't affect the main data.
-df_1 = df[['date','is_holiday','net_units','net_revenue']].copy()
-print(df_1.head())
-
 # %% [markdown]
 # ### Holiday Effect Towards Daily Sales and Revenue
 
@@ -69,10 +81,9 @@ print(df_1.head())
 # Sum sales (units) and revenue of all stores and products each day.
 
 # %%
-df_1 = df_1.groupby(df_1['date']).sum()
-# The line above sums all numeric data except `date` so `is_holiday` were also summed.
-# However, `is_holiday` is conditional data and is better represented as binary (0 or 1) in a day-by-day data.
-df_1.loc[df_1['is_holiday'] > 0, 'is_holiday'] = 1
+# `is_holiday` is conditional data and is better represented as binary (0 or 1) in a day-by-day data.
+# It is a calendar attribute of each date, so the cube is rolled up by it instead of summing it.
+df_1 = cube.rollup(['date', 'is_holiday'], ['net_units', 'net_revenue']).reset_index('is_holiday')
 print(df_1.head())
 
 # %% [markdown]
@@ -101,7 +112,7 @@ plt.show()
 # Every dates in the current data are already unique so we can erase the day in the `date` data to support monthly-based analysis process.
 
 # %%
-df_1.index = dtm(df_1.index)
+df_1.index = calendar_keys(cal, df_1.index, 'month')
 print(df_1.head())
 
 # %% [markdown]
@@ -135,26 +146,24 @@ plt.show()
 # ## 2. Is there any change in product category trend during no-holiday months and holiday months?
 
 # %% [markdown]
-# Get the necessary columns from the preprocessed data.
+# Sum sales (units) of each product category each day, keeping the holiday flag of the day.
 
 # %%
-# Each row is confirmed unique from the previous step so we can exclude the ID columns in this section.
-# Copy to ensure every change made in this section doesn't affect the main data.
-df_2 = df[['date','is_holiday','category','net_units']].copy()
+df_2 = cube.rollup(['date', 'is_holiday', 'category'], 'net_units').reset_index()
 print(df_2.head())
 
 # %% [markdown]
 # Every dates in the current data are already uniquely paired with each category so we can erase the day in the `date` data to support monthly-based analysis process.
 
 # %%
-df_2['date'] = dtm(df_2['date'])
+df_2['date'] = calendar_keys(cal, df_2['date'], 'month')
 print(df_2.head())
 
 # %% [markdown]
 # Count `net_units` by month and product category while keeping the `is_holiday` properties.
 
 # %%
-df_2 = df_2.groupby(['date', 'category'], as_index=False)[['is_holiday','net_units']].sum()
+df_2 = df_2.groupby(['date', 'category'], as_index=False, observed=True)[['is_holiday','net_units']].sum()
 # The above line will sum `is_holiday` and `net_units` data based on unique pairs of `date` and `category`.
 # However, in this section, we need `is_holiday` as a conditional data so it is better represented as binary (0 or 1).
 df_2.loc[df_2['is_holiday'] > 0, 'is_holiday'] = 1
@@ -180,23 +189,13 @@ print(df_2.head())
 # %% [markdown]
 # ## 3. Does the weekend status affect overall daily sales and revenue?
 
-# %% [markdown]
-# Get the necessary columns from the preprocessed data.
-
-# %%
-# Each row is confirmed unique from the previous step so we can exclude the ID columns in this section.
-# Copy to ensure every change made in this section doesn't affect the main data.
-df_3 = df[['date','weekend','net_units','net_revenue']].copy()
-print(df_3.head())
-
 # %% [markdown]
 # Sum sales (units) and revenue of all stores and products each day.
 
 # %%
-df_3 = df_3.groupby(df_3['date']).sum()
-# The line above sums all numeric data except `date` so `weekend` were also summed.
-# However, `weekend` is conditional data and is better represented as binary (0 or 1) in a day-by-day data.
-df_3.loc[df_3['weekend'] > 0, 'weekend'] = 1
+# `weekend` is conditional data and is better represented as binary (0 or 1) in a day-by-day data.
+# It is a calendar attribute of each date, so the cube is rolled up by it instead of summing it.
+df_3 = cube.rollup(['date', 'weekend'], ['net_units', 'net_revenue']).reset_index('weekend')
 print(df_3.head())
 
 # %% [markdown]
@@ -221,21 +220,11 @@ plt.show()
 # %% [markdown]
 # ## 4. How is the overall day-by-day sales and revenue trend during a week?
 
-# %% [markdown]
-# Get the necessary columns from the preprocessed data.
-
-# %%
-# Each row is confirmed unique from the previous step so we can exclude the ID columns in this section.
-# Because this section analyze day or `day_of_week` instead of `date`, we can also exclide the `date` column.
-# Copy to ensure every change made in this section doesn't affect the main data.
-df_4 = df[['day_of_week','net_units','net_revenue']].copy()
-print(df_4.head())
-
 # %% [markdown]
 # Find the average values of sales and revenue for each day of the week.
 
 # %%
-df_4 = df_4.groupby(df_4['day_of_week']).mean()
+df_4 = cube.rollup('day_of_week', ['net_units', 'net_revenue'], how='mean')
 print(df_4)
 
 # %%
@@ -243,7 +232,7 @@ print(df_4)
 fig, ax = plt.subplots(1, 2, figsize=(10,4))
 
 sns.barplot(
-        data=df, x='day_of_week', y='net_units', ax=ax[0],
+        data=df_4.reset_index(), x='day_of_week', y='net_units', ax=ax[0],
         errorbar=None, legend=False,
         hue='day_of_week', palette='crest'
     )
@@ -257,7 +246,7 @@ ax[0].set_xticks(
 )
 
 sns.barplot(
-        data=df, x='day_of_week', y='net_revenue', ax=ax[1],
+        data=df_4.reset_index(), x='day_of_week', y='net_revenue', ax=ax[1],
         errorbar=None, legend=False,
         hue='day_of_week', palette='crest'
     )
@@ -279,20 +268,11 @@ plt.show()
 # %% [markdown]
 # ## 5. Does the store type and area affect customer experience and, in turn, store sales?
 
-# %% [markdown]
-# Get the necessary columns from the preprocessed data.
-
-# %%
-# Each row is confirmed unique from the previous step so we can exclude the `date` and ID columns in this section.
-# Copy to ensure every change made in this section doesn't affect the main data.
-df_5 = df[['store_type','store_area_sqft','avg_rating','net_units','net_revenue']].copy()
-print(df_5.head())
-
 # %% [markdown]
 # Find the average values of customer experiences, sales, and revenue for each store type and area.
 
 # %%
-df_5 = df_5.groupby(['store_type', 'store_area_sqft'], as_index=False)[['avg_rating','net_units','net_revenue']].mean()
+df_5 = cube.rollup(['store_type', 'store_area_sqft'], ['avg_rating', 'net_units', 'net_revenue'], how='mean').reset_index()
 print(df_5)
 
 # %% [markdown]
@@ -302,8 +282,8 @@ print(df_5)
 # Find the average values of customer experiences, sales, and revenue for each store type only.
 
 # %%
-df_5_type = df_5.drop(columns='store_area_sqft').copy()
-df_5_type = df_5_type.groupby(df_5_type['store_type']).mean()
+df_5_type = df_5.drop(columns='store_area_sqft')
+df_5_type = df_5_type.groupby(df_5_type['store_type'], observed=True).mean()
 print(df_5_type)
 
 # %%
@@ -344,26 +324,24 @@ plt.show()
 # ## 6. Which category of product is the most popular in each city month-by-month?
 
 # %% [markdown]
-# Get the necessary columns from the preprocessed data.
+# Sum sales (units) of each product category in each city each day.
 
 # %%
-# Each row is confirmed unique from the previous step so we can exclude the `date` and ID columns in this section.
-# Copy to ensure every change made in this section doesn't affect the main data.
-df_6 = df[['date','city','category','net_units']].copy()
+df_6 = cube.rollup(['date', 'city', 'category'], 'net_units').reset_index()
 print(df_6.head())
 
 # %% [markdown]
 # Every dates in the current data are already uniquely paired with each category so we can erase the day in the `date` data to support monthly-based analysis process.
 
 # %%
-df_6['date'] = dtm(df_6['date'])
+df_6['date'] = calendar_keys(cal, df_6['date'], 'month')
 print(df_6.head())
 
 # %% [markdown]
 # Count `net_units` by month and product category while keeping the `city` data.
 
 # %%
-df_6 = df_6.groupby(['date', 'category','city'], as_index=False)[['net_units']].sum()
+df_6 = df_6.groupby(['date', 'category','city'], as_index=False, observed=True)[['net_units']].sum()
 df_6['city'] = df_6['city'].str.replace(r'city_(\d)$', r'city_0\1', regex=True)
 # The above line will sum `net_units` data based on unique pairs of `date`, `category`, and 'city'.
 print(df_6.head())
@@ -388,18 +366,16 @@ for city, df_city in city_dfs.items():
 # To simplify pattern analysis, we can group by continuous segments with the same category as below.
 
 # %%
-for city, df_city in city_dfs.items():
-    df_city_series = series_group(df_city, 'category', 'net_units')
-    print(city,':\n',df_city_series)
+# All cities are segmented in one call.
+df_cities_series = series_group(dfs_to_df(city_dfs, 'city'), 'category', 'net_units', by='city')
+for city, df_city_series in partition(df_cities_series, 'city').items():
+    print(city,':\n',df_city_series.reset_index(drop=True))
 
 # %%
 # Visualize results as heatmap correlation.
 # Regroup dictionary to a DataFrame.
 df_cities = dfs_to_df(city_dfs, 'city')
-months = sorted(
-    df_cities['date'].unique(),
-    key=lambda s: pd.to_datetime(s + '-01', errors='coerce')
-)
+months = sorted(df_cities['date'].unique())
 
 # Category mapping.
 # Use complete category from initial data.
@@ -462,14 +438,13 @@ plt.show()
 # ## 7. How does discount percentages on products affect store's sales and revenue?
 
 # %% [markdown]
-# Get the necessary columns from the preprocessed data.
+# Roll the aggregate cube up to the grain of this section.
 
 # %%
-# Each row is confirmed unique from the previous step so we can exclude the `date` in this section.
 # Discount percentage applies to one specific product and the product is not always on discount.
-# Therefore, we need to include product ID data and analyze the effect for each product
-# Copy to ensure every change made in this section doesn't affect the main data.
-df_7 = df[['product_id','discount_pct','net_units','net_revenue']].copy()
+# Therefore, we need to include product ID data and analyze the effect for each product.
+# The cube rollup gives the average sales and revenue of each product at each discount level.
+df_7 = cube.rollup(['product_id', 'discount_pct'], ['net_units', 'net_revenue'], how='mean').reset_index()
 print(df_7.head())
 
 # %%
@@ -494,7 +469,7 @@ print('prod_022:\n',disc_dfs['prod_022'].head())
 
 # %%
 for prod_id, df_disc in disc_dfs.items():
-    df_disc = df_disc.groupby('discount_pct')[['net_units', 'net_revenue']].mean()
+    df_disc = df_disc.set_index('discount_pct')[['net_units', 'net_revenue']]
     disc_dfs[prod_id] = df_disc
     # print('\n',prod_id,':\n',disc_dfs[prod_id])
 
@@ -572,9 +547,7 @@ plt.show()
 # Average mean difference percentages to find general insights.
 
 # %%
-disc_mat = []
-
-avg_disc_df = avg_dfitem(prod_id, df_disc, disc_dfs_mdiff, disc_mat)
+avg_disc_df = avg_dfitem(disc_dfs_mdiff)
 print(avg_disc_df)
 
 # %%
@@ -592,14 +565,13 @@ plt.show()
 # ## 8. How does product's promotion affect store's sales and revenue?
 
 # %% [markdown]
-# Get the necessary columns from the preprocessed data.
+# Roll the aggregate cube up to the grain of this section.
 
 # %%
-# Each row is confirmed unique from the previous step so we can exclude the `date` in this section.
 # Promotion applies to one specific product and the product is not always on promotion.
-# Therefore, we need to include product ID data and analyze the effect for each product
-# Copy to ensure every change made in this section doesn't affect the main data.
-df_8 = df[['product_id','promotion','net_units','net_revenue']].copy()
+# Therefore, we need to include product ID data and analyze the effect for each product.
+# The cube rollup gives the average sales and revenue of each product with and without promotion.
+df_8 = cube.rollup(['product_id', 'promotion'], ['net_units', 'net_revenue'], how='mean').reset_index()
 print(df_8.head())
 
 # %% [markdown]
@@ -619,27 +591,29 @@ print('prod_022:\n',promo_dfs['prod_022'].head())
 # Find the mean difference percentages between variables (`promotion`, `net_units`, and `net_revenue`) to analyze the effect of promotion to product sales and revenue.
 
 # %%
-promo_dfs_mdiff = promo_dfs.copy()
 print("Effect of Promotion to Each Product's Sales and Revenue by Mean Difference Percentages:")
-for prod_id, df_promo in promo_dfs_mdiff.items():
-    df_promo = binary_mean_diff(df_promo, 'promotion', 'both')
-    df_promo = pd.DataFrame([df_promo])
-    promo_dfs_mdiff[prod_id] = df_promo
-
-promo_mdiffs = dfs_to_df(promo_dfs_mdiff, 'prod_id')
+# Every product's effect in one grouped pass over the data.
+promo_effects = binary_effects(df_8, 'product_id', 'promotion', ['net_units', 'net_revenue'])
+promo_mdiffs = (
+    promo_effects.pivot(index='product_id', columns='metric', values='pct_diff')
+    .rename(columns={'net_units': 'sales_pct_diff', 'net_revenue': 'rev_pct_diff'})
+    [['sales_pct_diff', 'rev_pct_diff']]
+    .rename_axis(index='prod_id', columns=None)
+    .reset_index()
+)
 print(promo_mdiffs.head())
 
 # %%
 # Visualize results as stacked bar plot.
 pivot_sales = (
-    df_8.groupby(['product_id', 'promotion'])[['net_units']]
+    df_8.groupby(['product_id', 'promotion'], observed=True)[['net_units']]
       .mean()
       .unstack(fill_value=0)
 )
 pivot_sales.columns = ['No Promotion', 'Promotion']
 
 pivot_rev = (
-    df_8.groupby(['product_id', 'promotion'])[['net_revenue']]
+    df_8.groupby(['product_id', 'promotion'], observed=True)[['net_revenue']]
       .mean()
       .unstack(fill_value=0)
 )
@@ -668,11 +642,9 @@ plt.show()
 # Calculate average mean difference percentages for each product.
 
 # %%
-promo_mat = []
-
-avg_promo_df = avg_dfitem(prod_id, df_promo, promo_dfs_mdiff, promo_mat)
-print(f"Average effect of promotion on product sales: {avg_promo_df['sales_pct_diff'][0]:.2f}%")
-print(f"Average effect of promotion on product revenue: {avg_promo_df['rev_pct_diff'][0]:.2f}%")
+avg_promo_df = promo_mdiffs[['sales_pct_diff', 'rev_pct_diff']].mean()
+print(f"Average effect of promotion on product sales: {avg_promo_df['sales_pct_diff']:.2f}%")
+print(f"Average effect of promotion on product revenue: {avg_promo_df['rev_pct_diff']:.2f}%")
 
 # %% [markdown]
 # As shown above, promotion significantly affects sales and revenue. Its impact is far greater than that of discount percentages—around 67.8%. Moreover, promotion has a directly proportional relationship with both sales and revenue, where the presence of promotion consistently leads to higher values in both.
@@ -680,25 +652,21 @@ print(f"Average effect of promotion on product revenue: {avg_promo_df['rev_pct_d
 # %% [markdown]
 # ## 9. How does the combination of discount and promotion give different effect to store's sales and revenue?
 
-# %% [markdown]
-# Get the necessary columns from the preprocessed data.
-
-# %%
-# Each row is confirmed unique from the previous step so we can exclude the `date` in this section.
-# Promotion applies to one specific product and the product is not always on promotion.
-# Therefore, we need to include product ID data and analyze the effect for each product
-# Copy to ensure every change made in this section doesn't affect the main data.
-df_9 = df[['product_id','discount_pct','promotion','net_units','net_revenue']].copy()
-print(df_9.head())
-
 # %% [markdown]
 # To analyze how the combination of discount and promotion gives different effect to store's sales and revenue, we need to pair each discount and promotion in categories.
 # 
 # From the data preprocessing section, we already knew that the discount percentage value ranges from 0-30%. We will group these value into four categories: `no_disc`, `low_disc`, `mid_disc`, and `high_disc`. Meanwhile, the promotion value represents in a binary condition so there are only two categories: `no_promo` and `promo`.
 
 # %%
-df_9['disc_group'] = pd.cut(df_9['discount_pct'], bins=[-1, 0, 10, 20, 30], labels=['no_disc', 'low_disc', 'mid_disc', 'high_disc'])
-df_9['promo_group'] = df_9['promotion'].map({0: 'no_promo', 1: 'promo'})
+# Promotion applies to one specific product and the product is not always on promotion.
+# Therefore, we need to include product ID data and analyze the effect for each product.
+# The categories are assigned to the cube cells, so the cube rolls up to the average sales and revenue of each pair.
+disc_group = pd.cut(cube.facts['discount_pct'], bins=[-1, 0, 10, 20, 30], labels=['no_disc', 'low_disc', 'mid_disc', 'high_disc'])
+promo_group = cube.facts['promotion'].map({0: 'no_promo', 1: 'promo'})
+df_9 = cube.rollup(
+    ['product_id', disc_group.rename('disc_group'), promo_group.rename('promo_group')],
+    ['net_units', 'net_revenue'], how='mean'
+).reset_index()
 print(df_9.head())
 
 # %% [markdown]
@@ -709,9 +677,8 @@ comb_dfs = {}
 separate(df_9, comb_dfs, 'product_id')
 
 for prod_id, df_comb in comb_dfs.items():
-    df_comb = df_comb.drop(columns=['discount_pct','promotion'])
-    # We will do a cross group analysis process for each product, averaging values of sales and revenue for each combination of discount and promotion.
-    df_comb = df_comb.groupby(['disc_group', 'promo_group'], observed=True)[['net_units', 'net_revenue']].mean()
+    # We will do a cross group analysis process for each product, with the average values of sales and revenue for each combination of discount and promotion.
+    df_comb = df_comb.set_index(['disc_group', 'promo_group'])
     comb_dfs[prod_id] = df_comb
 
 # %%
@@ -724,9 +691,7 @@ print('prod_022:\n',comb_dfs['prod_022'])
 # Average mean values for each category to find general insights.
 
 # %%
-comb_mat = []
-
-avg_comb_df = avg_dfitem(prod_id, df_comb, comb_dfs, comb_mat, mode='cross')
+avg_comb_df = avg_dfitem(comb_dfs)
 print(avg_comb_df)
 
 # %%
@@ -769,14 +734,13 @@ plt.show()
 # ## 10. Does online transaction affect the customer experience (returns and rating)?
 
 # %% [markdown]
-# Get the necessary columns from the preprocessed data.
+# Roll the aggregate cube up to the grain of this section.
 
 # %%
-# Each row is confirmed unique from the previous step so we can exclude the `date` in this section.
 # Customer experience varies between stores.
 # Therefore, we need to include store ID data to analyze online transaction effect to customer experience.
-# Copy to ensure every change made in this section doesn't affect the main data.
-df_10 = df[['store_id', 'online','returns','avg_rating']].copy()
+# The cube rollup gives the average returns and rating of each store for offline and online transactions.
+df_10 = cube.rollup(['store_id', 'online'], ['returns', 'avg_rating'], how='mean').reset_index()
 print(df_10.head())
 
 # %% [markdown]
@@ -796,29 +760,28 @@ print('store_06:\n',cx_dfs['store_06'].head())
 # Find the mean difference percentages between variables (`online`, `returns`, and `avg_rating`) to analyze the effect of online transaction to customer experience.
 
 # %%
-cx_dfs_mdiff = cx_dfs.copy()
 print("Effect of Online Transaction to Each Store's Customer Experience by Mean Difference Percentages:")
-for store_id, df_cx in cx_dfs_mdiff.items():
-    df_cx = {
-        'returns': binary_mean_diff(df_cx, condition='online', mode='returns'), 
-        'avg_rating': binary_mean_diff(df_cx, condition='online', mode='avg_rating')}
-    df_cx = pd.DataFrame([df_cx])
-    cx_dfs_mdiff[store_id] = df_cx
-
-cx_mdiff = dfs_to_df(cx_dfs_mdiff, 'store_id')
+# Every store's effect in one grouped pass over the data.
+cx_effects = binary_effects(df_10, 'store_id', 'online', ['returns', 'avg_rating'])
+cx_mdiff = (
+    cx_effects.pivot(index='store_id', columns='metric', values='pct_diff')
+    [['returns', 'avg_rating']]
+    .rename_axis(columns=None)
+    .reset_index()
+)
 print(cx_mdiff.head())
 
 # %%
 # Visualize results as stacked bar plot.
 pivot_returns = (
-    df_10.groupby(['store_id', 'online'])[['returns']]
+    df_10.groupby(['store_id', 'online'], observed=True)[['returns']]
       .mean()
       .unstack(fill_value=0)
 )
 pivot_returns.columns = ['Offline', 'Online']
 
 pivot_ratings = (
-    df_10.groupby(['store_id', 'online'])[['avg_rating']]
+    df_10.groupby(['store_id', 'online'], observed=True)[['avg_rating']]
       .mean()
       .unstack(fill_value=0)
 )
@@ -847,11 +810,9 @@ plt.show()
 # Calculate average mean difference percentages for each store.
 
 # %%
-cx_mat = []
-
-avg_cx_df = avg_dfitem(store_id, df_cx, cx_dfs_mdiff, cx_mat)
-print(f"Average effect of online transaction on returns number: {avg_cx_df['returns'][0]:.2f}%")
-print(f"Average effect of online transaction on ratings: {avg_cx_df['avg_rating'][0]:.2f}%")
+avg_cx_df = cx_mdiff[['returns', 'avg_rating']].mean()
+print(f"Average effect of online transaction on returns number: {avg_cx_df['returns']:.2f}%")
+print(f"Average effect of online transaction on ratings: {avg_cx_df['avg_rating']:.2f}%")
 
 # %% [markdown]
 # As shown above, online transactions slightly affect both returns and ratings in a directly proportional manner. This is a surprising result, as an increase in returns usually corresponds to lower ratings.
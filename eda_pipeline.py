@@ -0,0 +1,307 @@
+import argparse
+import os
+
+import matplotlib.colors as mcolors
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+from calendar_dim import calendar_keys, sales_calendar
+from compact import compact
+from cube import SalesCube
+from helper import avg_dfitem, binary_effects, binary_mean_diff, df_base_diff, pad_ylim, partition, plot_bar, plot_stackedbar, series_group
+from ingest import DATA_PATH, read_sales, source_signature
+from report import FORMATS, render_figures
+from stages import CACHE_DIR, StageCache
+
+# The EDA of `eda.py` as named stages: ingest, per-question aggregation and effect computation.
+# Every stage is cached on disk under a hash of its code and input content (see `stages.py`),
+# so a re-run only recomputes the stages whose inputs or code changed.
+# Figures are rendered headless and in parallel by `report.py`, which skips the unchanged ones.
+OUT_DIR = './eda_output'
+cache = StageCache()
+
+# Ingest.
+
+@cache.stage
+def ingest(path, signature):
+    # The only stage that reads the raw rows; `signature` (size, mtime and schema of the source) keys it to the file.
+    df = compact(read_sales(path))
+    return SalesCube.build(df, sales_calendar(df))
+
+# Per-question aggregation.
+
+@cache.stage
+def daily_totals(cube, flag):
+    # Q1/Q3: daily sales and revenue with a calendar flag of the day (`is_holiday` or `weekend`).
+    return cube.rollup(['date', flag], ['net_units', 'net_revenue']).reset_index(flag)
+
+@cache.stage
+def monthly_totals(cube, daily):
+    # Q1: monthly sales and revenue with the number of holidays in the month.
+    monthly = daily.groupby(calendar_keys(cube.cal, daily.index, 'month')).sum()
+    return monthly
+
+@cache.stage
+def holiday_top_category(cube):
+    # Q2: most frequent top category of holiday and non-holiday months.
+    df_2 = cube.rollup(['date', 'is_holiday', 'category'], 'net_units').reset_index()
+    df_2['date'] = calendar_keys(cube.cal, df_2['date'], 'month')
+    df_2 = df_2.groupby(['date', 'category'], as_index=False, observed=True)[['is_holiday', 'net_units']].sum()
+    df_2.loc[df_2['is_holiday'] > 0, 'is_holiday'] = 1
+    df_2 = df_2.loc[df_2.groupby('date')['net_units'].idxmax()]
+    return df_2.groupby('is_holiday')['category'].agg(lambda x: x.mode()[0])
+
+@cache.stage
+def weekday_means(cube):
+    # Q4: average sales and revenue of each day of the week.
+    return cube.rollup('day_of_week', ['net_units', 'net_revenue'], how='mean')
+
+@cache.stage
+def store_means(cube):
+    # Q5: average rating, sales and revenue of each store type and area.
+    return cube.rollup(['store_type', 'store_area_sqft'], ['avg_rating', 'net_units', 'net_revenue'], how='mean').reset_index()
+
+@cache.stage
+def city_leaders(cube):
+    # Q6: top category of each city and month.
+    df_6 = cube.rollup(['month', 'city', 'category'], 'net_units').reset_index().rename(columns={'month': 'date'})
+    df_6['city'] = df_6['city'].str.replace(r'city_(\d)$', r'city_0\1', regex=True)
+    df_leaders = df_6.loc[df_6.groupby(['city', 'date'])['net_units'].idxmax()].reset_index(drop=True)
+    return df_leaders
+
+@cache.stage
+def city_segments(df_leaders):
+    # Q6: continuous segments of months with the same top category in each city.
+    return series_group(df_leaders, 'category', 'net_units', by='city')
+
+@cache.stage
+def monthly_series(cube, key=None):
+    # Monthly sales and revenue, company-wide or of every `key` (e.g. store_id) series, labelled by month end.
+    by = ['month_end'] if key is None else [key, 'month_end']
+    return cube.rollup(by, ['net_units', 'net_revenue'])
+
+@cache.stage
+def discount_means(cube):
+    # Q7: average sales and revenue of each product at each discount level.
+    return cube.rollup(['product_id', 'discount_pct'], ['net_units', 'net_revenue'], how='mean').reset_index()
+
+@cache.stage
+def combination_means(cube):
+    # Q9: average sales and revenue of each discount band and promotion pair, averaged over products.
+    disc_group = pd.cut(cube.facts['discount_pct'], bins=[-1, 0, 10, 20, 30], labels=['no_disc', 'low_disc', 'mid_disc', 'high_disc'])
+    promo_group = cube.facts['promotion'].map({0: 'no_promo', 1: 'promo'})
+    df_9 = cube.rollup(
+        ['product_id', disc_group.rename('disc_group'), promo_group.rename('promo_group')],
+        ['net_units', 'net_revenue'], how='mean'
+    ).reset_index()
+    return avg_dfitem(df_comb.set_index(['disc_group', 'promo_group']) for df_comb in partition(df_9, 'product_id').values())
+
+# Effect computation.
+
+@cache.stage
+def flag_effect(table, flag):
+    # Q1/Q3: percent difference of the average sales and revenue with and without the flag.
+    return binary_mean_diff(table, flag, 'both')
+
+@cache.stage
+def discount_effects(df_means):
+    # Q7: percent difference of each discount level to no discount, averaged over products.
+    discs = partition(df_means, 'product_id').values()
+    return avg_dfitem(df_base_diff(df_disc.set_index('discount_pct')) for df_disc in discs)
+
+@cache.stage
+def entity_effects(cube, key, condition, metrics):
+    # Q8/Q10: average of each metric with and without a binary condition, and its percent lift, per entity.
+    df_means = cube.rollup([key, condition], metrics, how='mean').reset_index()
+    return binary_effects(df_means, key, condition, metrics)
+
+# Figures: draw functions for `report.render_figures`, which renders them headless in parallel
+# and skips a figure when its draw code and input table are unchanged.
+
+def draw_flag_bars(fig, table, flag, labels, period):
+    ax = fig.subplots(1, 2)
+    plot_bar(table, flag, 'net_units', f'Average {period} Sales', 'Sales', *labels, ax=ax[0])
+    plot_bar(table, flag, 'net_revenue', f'Average {period} Revenue', 'Revenue', *labels, ax=ax[1])
+    fig.tight_layout()
+
+def draw_weekday(fig, df_4):
+    ax = fig.subplots(1, 2)
+    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    for i, (y, title, ylabel) in enumerate([('net_units', 'Average Sales of A Week', 'Sales'), ('net_revenue', 'Average Revenue of A Week', 'Revenue')]):
+        plot_bar(df_4.reset_index(), 'day_of_week', y, title, 'Day of The Week', ylabel, ax=ax[i])
+        ax[i].set_xticks(range(7), days, rotation=45)
+    fig.tight_layout()
+
+def draw_store_type(fig, df_5_type):
+    ax = fig.subplots(1, 3)
+    plot_bar(df_5_type, 'store_type', 'avg_rating', 'Average Customer Ratings', xlabel='Store Type', ylabel='Customer Ratings', ax=ax[0])
+    plot_bar(df_5_type, 'store_type', 'net_units', 'Average Store Sales', xlabel='Store Type', ylabel='Sales', ax=ax[1])
+    plot_bar(df_5_type, 'store_type', 'net_revenue', 'Average Store Revenue', xlabel='Store Type', ylabel='Revenue', ax=ax[2])
+    fig.tight_layout()
+
+def draw_store_area(fig, df_5_area):
+    ax = fig.subplots()
+    labels = ['Store Area (sqft)', 'Customer Ratings', 'Sales', 'Revenue']
+    sns.heatmap(df_5_area, annot=True, cmap='crest', fmt='.2f', ax=ax)
+    ax.set_title('Correlation Heatmap')
+    ax.set_xticks(np.arange(df_5_area.shape[1]) + 0.5, labels, rotation=45, ha='right', rotation_mode='anchor')
+    ax.set_yticks(np.arange(df_5_area.shape[0]) + 0.5, labels, va='center')
+
+def draw_city_leaders(fig, df_leaders):
+    cats = list(pd.unique(df_leaders['category']))
+    codes = df_leaders.assign(cat_code=pd.Categorical(df_leaders['category'], categories=cats).codes)
+    pivot = codes.pivot(index='city', columns='date', values='cat_code').sort_index()
+
+    main_palette = sns.color_palette('Set3', 12)
+    cmap = mcolors.ListedColormap([main_palette[i] for i in [1,0,2,4,7]][:len(cats)])
+    norm = mcolors.BoundaryNorm(np.arange(len(cats) + 1) - 0.5, cmap.N)
+
+    ax = fig.subplots()
+    sns.heatmap(pivot, cmap=cmap, norm=norm, cbar=True, linewidths=0.5, linecolor='white', ax=ax)
+    ax.set_title('Top Category per City (Month-by-Month)')
+    ax.set_xlabel('Month')
+    ax.set_ylabel('')
+    cbar = ax.collections[0].colorbar
+    cbar.set_ticks(np.arange(len(cats)))
+    cbar.set_ticklabels(cats)
+    fig.tight_layout()
+
+def draw_discount(fig, avg_disc_df):
+    ax = fig.subplots(1, 2)
+    plot_bar(avg_disc_df.reset_index(), 'discount_pct', 'net_units', 'Average Product Sales', 'Sales', ax=ax[0])
+    plot_bar(avg_disc_df.reset_index(), 'discount_pct', 'net_revenue', 'Average Product Revenue', 'Revenue', ax=ax[1])
+    fig.tight_layout()
+
+def draw_effect_stacked(fig, df_effect, key, labels, panels):
+    # Stacked bars of each entity's averages without/with the condition (`panels`: metric, title, xlabel, ylabel).
+    ax = fig.subplots(1, len(panels))
+    for i, (metric, title, xlabel, ylabel) in enumerate(panels):
+        pivot = df_effect[df_effect['metric'] == metric].set_index(key)[['mean_neg', 'mean_pos']]
+        pivot.columns = labels
+        plot_stackedbar(pivot, title, xlabel, ylabel, len(pivot), ax=ax[i])
+    fig.tight_layout()
+
+def draw_combination(fig, avg_comb_df):
+    ax = fig.subplots(1, 2)
+    ticks = ['No Discount (0%)', 'Low Discount (0-10%)', 'Mid Discount (10-20%)', 'High Discount (20-30%)']
+    for i, (y, title, ylabel) in enumerate([('net_units', 'Sales by Discount and Promotion', 'Sales'), ('net_revenue', 'Revenue by Discount and Promotion', 'Revenue')]):
+        sns.barplot(avg_comb_df.reset_index(), ax=ax[i], x='disc_group', y=y, hue='promo_group', palette='crest')
+        ax[i].set_title(title)
+        ax[i].set_xlabel('')
+        ax[i].set_ylabel(ylabel)
+        ax[i].set_xticks(range(4), ticks)
+        ax[i].legend(title='', labels=['No Promotion', 'Promotion'])
+        pad_ylim(ax[i])
+    fig.tight_layout()
+
+def draw_monthly(fig, df_monthly, title=None):
+    # Monthly sales and revenue on twin axes, as in `forecast.py`.
+    ax1 = fig.subplots()
+    color = 'tab:blue'
+    ax1.plot(df_monthly['net_units'], color=color)
+    ax1.set_xlabel('Months')
+    ax1.set_ylabel('Sales', color=color)
+    ax1.tick_params(axis='y', labelcolor=color)
+
+    ax2 = ax1.twinx()
+    color = 'tab:green'
+    ax2.plot(df_monthly['net_revenue'], color=color)
+    ax2.set_ylabel('Revenue', color=color)
+    ax2.tick_params(axis='y', labelcolor=color)
+    if title:
+        ax1.set_title(title)
+    fig.tight_layout()
+
+def run(path=DATA_PATH, out_dir=OUT_DIR, formats=FORMATS, n_jobs=None, entity_keys=()):
+    # `entity_keys` (e.g. ['store_id', 'product_id']) adds a monthly sales/revenue figure of every store/product.
+    cube = ingest(path, source_signature(path))
+
+    # 1. Holiday effect (daily and monthly).
+    daily_holiday = daily_totals(cube, 'is_holiday')
+    monthly_holiday = monthly_totals(cube, daily_holiday)
+    # 2. Top category in holiday and non-holiday months.
+    top_category = holiday_top_category(cube)
+    # 3. Weekend effect.
+    daily_weekend = daily_totals(cube, 'weekend')
+    # 4. Day of the week.
+    df_4 = weekday_means(cube)
+    # 5. Store type and area.
+    df_5 = store_means(cube)
+    df_5_type = df_5.value.drop(columns='store_area_sqft').groupby('store_type', observed=True).mean()
+    df_5_area = df_5.value[['store_area_sqft', 'avg_rating', 'net_units', 'net_revenue']].corr()
+    # 6. Top category per city.
+    df_leaders = city_leaders(cube)
+    df_segments = city_segments(df_leaders)
+    # 7. Discount levels.
+    avg_disc_df = discount_effects(discount_means(cube))
+    # 8. Promotion.
+    promo_effects = entity_effects(cube, 'product_id', 'promotion', ['net_units', 'net_revenue'])
+    # 9. Discount and promotion combinations.
+    avg_comb_df = combination_means(cube)
+    # 10. Online transactions.
+    cx_effects = entity_effects(cube, 'store_id', 'online', ['returns', 'avg_rating'])
+
+    effects = {
+        'holiday_daily': flag_effect(daily_holiday, 'is_holiday').value,
+        'holiday_monthly': flag_effect(monthly_holiday, 'is_holiday').value,
+        'weekend_daily': flag_effect(daily_weekend, 'weekend').value,
+        'promotion': promo_effects.value.groupby('metric', sort=False)['pct_diff'].mean().to_dict(),
+        'online': cx_effects.value.groupby('metric', sort=False)['pct_diff'].mean().to_dict()
+    }
+    tables = {
+        'top_category': top_category, 'weekday': df_4, 'store_type': df_5_type, 'store_area': df_5_area,
+        'city_segments': df_segments, 'discount': avg_disc_df, 'combination': avg_comb_df
+    }
+    tables = {name: table.value if hasattr(table, 'value') else table for name, table in tables.items()}
+
+    holiday_labels = ['Not Holiday', 'Holiday']
+    figures = {
+        'holiday_daily': (draw_flag_bars, daily_holiday.value, {'flag': 'is_holiday', 'labels': holiday_labels, 'period': 'Daily'}),
+        'holiday_monthly': (draw_flag_bars, monthly_holiday.value, {'flag': 'is_holiday', 'labels': holiday_labels, 'period': 'Monthly'}),
+        'weekend': (draw_flag_bars, daily_weekend.value, {'flag': 'weekend', 'labels': ['Weekday', 'Weekend'], 'period': 'Weekend'}),
+        'weekday': (draw_weekday, tables['weekday'], {}),
+        'store_type': (draw_store_type, df_5_type, {'figsize': (15,4)}),
+        'store_area': (draw_store_area, df_5_area, {'figsize': (5,4)}),
+        'city_leaders': (draw_city_leaders, df_leaders.value, {'figsize': (15,5)}),
+        'discount': (draw_discount, tables['discount'], {}),
+        'promotion': (draw_effect_stacked, promo_effects.value, {
+            'key': 'product_id', 'labels': ['No Promotion', 'Promotion'], 'figsize': (25,5),
+            'panels': [('net_units', 'Sales by Product and Promotion', 'Product ID', 'Sales'),
+                       ('net_revenue', 'Revenue by Product and Promotion', 'Product ID', 'Revenue')]}),
+        'combination': (draw_combination, tables['combination'], {'figsize': (15,5)}),
+        'online': (draw_effect_stacked, cx_effects.value, {
+            'key': 'store_id', 'labels': ['Offline', 'Online'], 'figsize': (10,5),
+            'panels': [('returns', 'Returns by Store and Transaction Method', 'Store ID', 'Returns'),
+                       ('avg_rating', 'Ratings by Store and Transaction Method', 'Store ID', 'Ratings')]}),
+        'monthly': (draw_monthly, monthly_series(cube).value, {'figsize': (10,5)})
+    }
+    # Per-store and per-product monthly series, one figure each.
+    for key in entity_keys:
+        for entity, df_entity in partition(monthly_series(cube, key).value.reset_index(), key).items():
+            figures[f'{key}/{entity}'] = (draw_monthly, df_entity.set_index('month_end')[['net_units', 'net_revenue']], {'title': f'{key} {entity}', 'figsize': (10,5)})
+        os.makedirs(os.path.join(out_dir, key), exist_ok=True)
+
+    rendered = render_figures(figures, out_dir, formats, n_jobs)
+    return effects, tables, (len(rendered), len(figures))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the EDA as cached stages; only stages with changed inputs or code are recomputed.')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--out', default=OUT_DIR, help='Directory for the rendered figures.')
+    parser.add_argument('--cache', default=CACHE_DIR, help='Stage cache directory.')
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS), help='Figure formats, e.g. png svg.')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of rendering processes (default: all cores).')
+    parser.add_argument('--per-entity', action='store_true', help='Also render the monthly series of every store and product.')
+    args = parser.parse_args()
+
+    cache.cache_dir = args.cache
+    entity_keys = ['store_id', 'product_id'] if args.per_entity else []
+    effects, tables, (n_rendered, n_figures) = run(args.data, args.out, args.formats, args.jobs, entity_keys)
+    for name, effect in effects.items():
+        print(f'{name}: ' + ', '.join(f'{k} {v:.2f}%' for k, v in effect.items()))
+    for name, table in tables.items():
+        print(f'\n{name}:\n{table}')
+    print(f'\nRendered {n_rendered} of {n_figures} figures (the rest were unchanged).')
+    print('\nStages:')
+    print(cache.report())
@@ -0,0 +1,104 @@
+import argparse
+import multiprocessing as mp
+import os
+import time
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from aggregate import monthly, split_series
+from artifact import save_artifact
+from ingest import DATA_PATH, read_sales
+from model import SPECS, fit_sarimax, p_cols, y_cols
+from registry import MANIFEST, build_manifest, write_manifest
+
+SERIES_KEYS = ['store_id', 'product_id']
+
+def series_frames(df, keys=SERIES_KEYS):
+    # One pass over the raw data gives the monthly endog/exog frame of every series.
+    df_monthly = monthly(df, keys)
+    return split_series(df_monthly, keys)
+
+def series_dir(out_dir, key):
+    return os.path.join(out_dir, *[str(k) for k in key])
+
+def fit_series(key, frame, out_dir, specs=SPECS):
+    # Fit and save both target models of a single series.
+    # Any failure is reported back instead of raised, so one bad series cannot stop the fleet.
+    start = time.perf_counter()
+    report = {'key': key, 'status': 'ok', 'error': None, 'converged': {}}
+    try:
+        scaler = StandardScaler()
+        X = pd.DataFrame(scaler.fit_transform(frame[p_cols]), index=frame.index, columns=p_cols)
+
+        path = series_dir(out_dir, key)
+        os.makedirs(path, exist_ok=True)
+        for y_col, spec in specs.items():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                result = fit_sarimax(frame[y_col], X, spec['order'], spec['seasonal_order'])
+            report['converged'][y_col] = bool(result.mle_retvals.get('converged', False))
+            save_artifact(os.path.join(path, f'model_{y_col}.joblib'), result, scaler, target=y_col, last_period=frame['date'].iloc[-1])
+    except Exception as e:
+        report['status'] = 'failed'
+        report['error'] = ''.join(traceback.format_exception_only(type(e), e)).strip()
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+def process_pool(n_jobs):
+    # Each SARIMAX fit is single-threaded work, so the pool is sized to the cores and BLAS is kept to one thread per worker.
+    # Workers are spawned (not forked) so they start with these settings and without a copy of the raw data.
+    for var in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+        os.environ.setdefault(var, '1')
+    return ProcessPoolExecutor(max_workers=n_jobs, mp_context=mp.get_context('spawn'))
+
+def train_fleet(df, out_dir='./fleet', keys=SERIES_KEYS, n_jobs=None, specs=SPECS):
+    frames = series_frames(df, keys)
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    reports = []
+    if n_jobs == 1:
+        for key, frame in frames.items():
+            reports.append(fit_series(key, frame, out_dir, specs))
+    else:
+        with process_pool(n_jobs) as pool:
+            futures = {pool.submit(fit_series, key, frame, out_dir, specs): key for key, frame in frames.items()}
+            for future in as_completed(futures):
+                try:
+                    reports.append(future.result())
+                except Exception as e:
+                    # The worker process itself died (e.g. out of memory).
+                    reports.append({'key': futures[future], 'status': 'failed', 'error': repr(e), 'converged': {}, 'seconds': None})
+
+    df_report = pd.DataFrame([
+        {
+            **dict(zip(keys, r['key'])),
+            'status': r['status'],
+            **{f'converged_{y_col}': r['converged'].get(y_col) for y_col in y_cols},
+            'seconds': r['seconds'],
+            'error': r['error']
+        }
+        for r in reports
+    ]).sort_values(keys).reset_index(drop=True)
+    os.makedirs(out_dir, exist_ok=True)
+    df_report.to_csv(os.path.join(out_dir, 'fleet_report.csv'), index=False)
+    # Manifest of the fitted models, so `serve.py` can load them lazily (see `registry.py`).
+    write_manifest(build_manifest(out_dir, out_dir), os.path.join(out_dir, MANIFEST))
+    return df_report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit one SARIMAX model per store/product series and target.')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--out', default='./fleet')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes (default: all cores).')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df_report = train_fleet(read_sales(args.data), args.out, n_jobs=args.jobs)
+    n_failed = (df_report['status'] != 'ok').sum()
+    print(f'Fitted {len(df_report) - n_failed}/{len(df_report)} series in {time.perf_counter() - start:.1f}s.')
+    if n_failed:
+        print(df_report.loc[df_report['status'] != 'ok', SERIES_KEYS + ['error']])
@@ -2,14 +2,24 @@
 # # Import all packages/library.
 
 # %%
-import joblib
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+from aggregate import monthly
+from artifact import CompactSARIMAX, save_artifact, to_artifact
+from baselines import errors as baseline_errors, forecast as forecast_baselines, panel
+from fleet import SERIES_KEYS
+from ingest import read_sales
+from instrument import Tracer, optimizer_stats
+from reconcile import METHODS as RECONCILE_METHODS, Hierarchy, bottom_series, reconcile
+from simulate import forecast_intervals
 from sklearn.metrics import mean_absolute_error, mean_absolute_percentage_error
 from sklearn.preprocessing import StandardScaler
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 
+# Time and memory of each stage of this run (see `instrument.py`), saved as a JSON trace at the end.
+tracer = Tracer('forecast')
+
 # %% [markdown]
 # # Data Preparation
 
@@ -19,8 +29,10 @@ from statsmodels.tsa.statespace.sarimax import SARIMAX
 # %%
 # From the previous process, 
 # we know that the raw data is already cleaned and ready-to-use.
-raw_df = pd.read_csv('./data/retail_sales_synthetic.csv')
-df = raw_df.copy()  # Copy to ensure every change made in this code doesn't affect the raw data.
+# The CSV is parsed once with an explicit schema (e.g. `date` as datetime) and reused from its Parquet cache.
+with tracer.stage('read_sales'):
+    raw_df = read_sales('./data/retail_sales_synthetic.csv')
+df = raw_df  # No copy needed: the column selection below gives a new frame, so the raw data is never changed.
 # print(df.head())
 
 # %% [markdown]
@@ -40,12 +52,6 @@ df = df[[
     'discount_pct'
     ]]
 
-# %% [markdown]
-# Convert `date` DataType to datetime.
-
-# %%
-df['date'] = pd.to_datetime(df['date'])
-
 # %% [markdown]
 # ## Aggregate Data
 
@@ -64,19 +70,12 @@ df['date'] = pd.to_datetime(df['date'])
 # - For `discount_pct`, we need to calculate the average discount percentages given in a month (0-30%) as it is given per product.
 
 # %%
-df_monthly = (
-    df.groupby(pd.Grouper(key='date', freq='ME'))   # Aggregate data by date in monthly frequency.
-      .agg({
-          'net_units': 'sum',
-          'net_revenue': 'sum',
-          'promotion': 'mean',      # Calculate promotion proportion in a month.
-          'is_holiday': 'max',      # Label for holiday/non-holiday month.
-          'weekend': 'mean',        # Calculate weekend proportion in a month.
-          'discount_pct': 'mean'    # Calculate average discount given in a month.
-          # To do overall performance analysis, store type is excluded to avoid bias.
-      })
-      .reset_index()
-)
+# Aggregate data by date in monthly frequency with the rules above (see `aggregate.MONTHLY_AGG`).
+# The same aggregation is reused by the per-series fleet (`fleet.py`), so both always agree.
+# To do overall performance analysis, store type is excluded to avoid bias.
+# When the daily history does not fit in memory, `aggregate.monthly_chunked(path)` streams the file and gives the same frame.
+with tracer.stage('monthly_aggregation'):
+    df_monthly = monthly(df)
 
 print(df_monthly.head())
 
@@ -134,9 +133,10 @@ p_cols = ['promotion', 'is_holiday', 'weekend', 'discount_pct'] # Exogenous vari
 # This step is necessary because the exogenous variables vary in scale.
 
 # %%
-scaler = StandardScaler()
-X_train = scaler.fit_transform(train[p_cols])
-X_test  = scaler.transform(test[p_cols])
+with tracer.stage('scaler_fit'):
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(train[p_cols])
+    X_test  = scaler.transform(test[p_cols])
 
 # Convert to DataFrames
 X_train = pd.DataFrame(X_train, index=train.index, columns=p_cols)
@@ -149,23 +149,27 @@ X_test  = pd.DataFrame(X_test,  index=test.index,  columns=p_cols)
 models = {}                         # Models holder.
 
 # Build model.
-model_units = SARIMAX(
-    endog=np.log1p(train['net_units']),       # Endogenous variable values.
-    exog=X_train,                   # Exogenous variables values.
-    order=(1,1,0),                  # p, d, q values in non-seasonal prediction.
-    seasonal_order=(0,1,1,12),      # p, d, q, m values in seasonal prediction.
-    enforce_stationarity=False, 
-    enforce_invertibility=False
-).fit(disp=False)
-
-model_rev = SARIMAX(
-    endog=np.log1p(train['net_revenue']),     # Endogenous variable values.
-    exog=X_train,                   # Exogenous variables values.
-    order=(1,0,1),                  # p, d, q values in non-seasonal prediction.
-    seasonal_order=(0,1,1,12),      # p, d, q, m values in seasonal prediction.
-    enforce_stationarity=False, 
-    enforce_invertibility=False
-).fit(disp=False)
+with tracer.stage('sarimax_fit', target='net_units') as span:
+    model_units = SARIMAX(
+        endog=np.log1p(train['net_units']),       # Endogenous variable values.
+        exog=X_train,                   # Exogenous variables values.
+        order=(1,1,0),                  # p, d, q values in non-seasonal prediction.
+        seasonal_order=(0,1,1,12),      # p, d, q, m values in seasonal prediction.
+        enforce_stationarity=False, 
+        enforce_invertibility=False
+    ).fit(disp=False)
+    span.update(optimizer_stats(model_units))     # Iterations, function evaluations and convergence.
+
+with tracer.stage('sarimax_fit', target='net_revenue') as span:
+    model_rev = SARIMAX(
+        endog=np.log1p(train['net_revenue']),     # Endogenous variable values.
+        exog=X_train,                   # Exogenous variables values.
+        order=(1,0,1),                  # p, d, q values in non-seasonal prediction.
+        seasonal_order=(0,1,1,12),      # p, d, q, m values in seasonal prediction.
+        enforce_stationarity=False, 
+        enforce_invertibility=False
+    ).fit(disp=False)
+    span.update(optimizer_stats(model_rev))
 
 # Save models to holder.
 models['net_units'] = {'model': model_units}
@@ -176,7 +180,8 @@ models['net_revenue'] = {'model': model_rev}
 results = {}    # Prediction results holder.
 
 for y_col in y_cols: 
-    pred_log = models[y_col]['model'].get_forecast(steps=h, exog=X_test).predicted_mean
+    with tracer.stage('get_forecast', target=y_col):
+        pred_log = models[y_col]['model'].get_forecast(steps=h, exog=X_test).predicted_mean
     pred = np.expm1(pred_log)
     results[y_col] = {'pred': pred}
 
@@ -284,9 +289,74 @@ plt.show()
 # %% [markdown]
 # The residual plots confirm the earlier findings: slight initial underfitting in the sales model and higher sensitivity which led to bias in the revenue model.
 
+# %% [markdown]
+# ### Prediction Intervals
+# The forecasts above are back-transformed log-space means, so they carry no uncertainty. Intervals cannot be obtained by exponentiating log-space intervals either, at least not for horizon totals. Instead, thousands of future paths are simulated from each model's state space form (see `simulate.py`), back-transformed, and then summarized as P10/P50/P90 of each month (`p10`, `p50`, `p90`) and of the cumulative total up to that month (`cum_*`).
+
+# %%
+with tracer.stage('forecast_intervals'):
+    compact_models = {y_col: CompactSARIMAX(to_artifact(models[y_col]['model'])) for y_col in y_cols}
+    intervals = forecast_intervals(compact_models, h, X_test.values, scaled=True)
+intervals['actual'] = [test[y_col].iloc[step - 1] for y_col, step in zip(intervals['key'], intervals['step'])]
+print(intervals[['key', 'step', 'p10', 'p50', 'p90', 'actual', 'cum_p10', 'cum_p50', 'cum_p90']].round(0))
+
 # %% [markdown]
 # ### Baseline Model
-# A baseline comparison (e.g., Seasonal Naïve) could be applied to benchmark SARIMAX performance. However, since SARIMAX already captures both trend and seasonality effectively, and the dataset is relatively short, this comparison is omitted to avoid redundancy.
+# The SARIMAX scores are benchmarked against simple baselines fitted on the same training months: seasonal naïve (each month repeats the same month of last year), drift (the last value moved along the average change) and simple exponential smoothing (SES). A model that does not beat them adds no value over a naive forecast. The baseline engine (`baselines.py`) treats both targets as rows of one panel, exactly as it scores thousands of store/product series at once.
+
+# %%
+baselines = forecast_baselines(train[y_cols].to_numpy(dtype=float).T, h)
+
+df_eval = pd.DataFrame([
+    {'target': y_col, 'model': 'SARIMAX', **eval[y_col]} for y_col in y_cols
+] + [
+    {
+        'target': y_col, 'model': method,
+        'MAE': mean_absolute_error(test[y_col], pred[i]),
+        'MAPE': mean_absolute_percentage_error(test[y_col], pred[i])*100
+    }
+    for method, pred in baselines.items() for i, y_col in enumerate(y_cols)
+])
+print(df_eval.sort_values(['target', 'MAPE']).round(2).to_string(index=False))
+
+# %% [markdown]
+# Seasonal naïve beats SARIMAX on this 6-month test window for both targets, while drift and SES, which ignore seasonality, are far behind. With only 2 years of training data, last year's pattern is already a strong forecast, and this single window is too short to rank the models. The rolling-origin backtest (`backtest.py`) compared with `baselines.py --min-train 24` scores both over many cutoffs, and `baselines.worse_than_baseline` lists the series where SARIMAX loses.
+
+# %% [markdown]
+# ### Hierarchical Reconciliation
+# The company-wide models are only the top of a hierarchy: store/product series add up to stores, cities, regions and the company total, and to products and categories. Forecasts made separately at each level do not add up. Reconciliation (`reconcile.py`) adjusts them so that they do, with a sparse summing matrix that scales to tens of thousands of store/product series:
+# - **Bottom-up:** sums of the store/product forecasts.
+# - **OLS:** the smallest adjustment that makes all levels add up.
+# - **MinT-shrink:** adjustments weighted by the (shrunk) covariance of the in-sample errors of each level, so the most reliable forecasts move the least.
+# 
+# Here, the company total keeps its SARIMAX forecast and every other series gets a seasonal naïve forecast (`baselines.py`). The table shows the mean test MAPE of each level before (`base`) and after reconciliation.
+
+# %%
+hier = Hierarchy(bottom_series(raw_df))
+df_series = monthly(df, SERIES_KEYS)
+n_train, season = len(train), 12
+
+df_hier = []
+for y_col in y_cols:
+    keys, Y = panel(df_series, y_col, SERIES_KEYS)
+    Y = hier.aggregate(pd.DataFrame(Y, index=pd.MultiIndex.from_tuples(keys)))     # Every level (rows of `hier.index`).
+
+    base = forecast_baselines(Y[:, :n_train], h)['seasonal_naive']
+    residuals = (Y[:, season:n_train] - Y[:, :n_train - season]).T
+    # The company total (first row) from SARIMAX, with its in-sample errors in original units.
+    base[0] = results[y_col]['pred']
+    residuals[:, 0] = (train[y_col] - np.expm1(models[y_col]['model'].fittedvalues)).values[season:]
+
+    forecasts = {'base': base, **{method: reconcile(hier, base, method, residuals) for method in RECONCILE_METHODS}}
+    for method, y_rec in forecasts.items():
+        _, mape = baseline_errors(Y[:, n_train:], y_rec)
+        mape = pd.Series(mape, index=hier.index.get_level_values('level')).groupby(level=0, sort=False).mean()
+        df_hier.append({'target': y_col, 'method': method, **mape})
+
+print(pd.DataFrame(df_hier).round(2).to_string(index=False))
+
+# %% [markdown]
+# Seasonal naïve forecasts already add up (the sum of last year's values is last year's sum), so only the SARIMAX total disagrees with the levels below it. OLS spreads the gap over every series, which pulls the total towards the bottom-up sum but also makes every lower level worse. MinT-shrink weighs the series by their in-sample errors and lands almost on the bottom-up total, which is also the better total in this test window (see the baseline comparison above). Store and city scores are equal because each city has a single store in this data.
 
 # %% [markdown]
 # ## Save Model
@@ -294,11 +364,19 @@ plt.show()
 # %% [markdown]
 # Saving the trained models ensures reproducibility and allows future forecasting using new data without retraining from scratch.  
 # 
+# Each model is saved as a compact artifact (see `artifact.py`): its spec, fitted parameters, the state after the last training month and the scaler stats. Unlike a full results pickle, it excludes the training data and filter output, so it stays a few KB and loads in milliseconds. Load it with `artifact.load_artifact`, and bring it up to date every month with `retrain.py` instead of refitting from scratch.
+# 
 # **Note:** To reuse the model effectively, the input features and seasonal pattern should remain consistent with the trained model. Otherwise, performance may degrade.
 
 # %%
-models['net_units']['model'].save('model_net_units.pkl')
-models['net_revenue']['model'].save('model_net_revenue.pkl')
-joblib.dump(scaler, 'models_exog_scaler.pkl')
+for y_col in y_cols:
+    # The last training month lets `retrain.py` filter in newly closed months later on.
+    with tracer.stage('save_artifact', target=y_col):
+        save_artifact(f'model_{y_col}.joblib', models[y_col]['model'], scaler, target=y_col, last_period=train['date'].iloc[-1])
+
+# %%
+# Save the stage trace of this run (wall/CPU time, memory and optimizer statistics of every stage).
+tracer.save('forecast_trace.json')
+# print(tracer.summary())
 
 
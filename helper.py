@@ -3,28 +3,53 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 
-def avg_dfitem(item, df, dfs, mat, mode=''):
+def avg_dfitem(dfs, dispersion=False, ddof=0):
+    # Element-wise average of equally shaped frames (a dict of DataFrames or any iterable of them).
+    # Frames are consumed one at a time into a running sum and count, so memory does not grow with the number of items.
+    # With `dispersion`, the element-wise standard deviation (Welford's running variance) is returned too.
+    frames = dfs.values() if isinstance(dfs, dict) else dfs
+    count = 0
+    for df in frames:
+        values = df.to_numpy(dtype=float)
+        if count == 0:
+            index, columns = df.index, df.columns
+            total = np.zeros_like(values)
+            if dispersion:
+                mean, m2 = np.zeros_like(values), np.zeros_like(values)
+        elif not (df.index.equals(index) and df.columns.equals(columns)):
+            raise ValueError('Every DataFrame in dfs must have the same index and columns.')
+
+        count += 1
+        total += values
+        if dispersion:
+            delta = values - mean
+            mean += delta / count
+            m2 += delta * (values - mean)
+
     # Check if `dfs` is empty.
-    if not dfs:
+    if count == 0:
         raise ValueError('Please pass a non-empty dict of DataFrames (dfs).')
-    
-    for item, df in dfs.items():
-        mat.append(df)
-
-    stack = np.stack([c.values for c in mat])
-    avg_data = stack.mean(axis=0)
-
-    if mode=='cross':
-        cross_group = next(iter(dfs.values()))
-        avg_df = pd.DataFrame(avg_data, 
-                                index=cross_group.index, 
-                                columns=cross_group.columns)
-    else:
-        avg_df = pd.DataFrame(avg_data, 
-                            index=df.index, 
-                            columns=df.columns)
 
-    return avg_df
+    avg_df = pd.DataFrame(total / count, index=index, columns=columns)
+    if not dispersion:
+        return avg_df
+    std_df = pd.DataFrame(np.sqrt(m2 / max(count - ddof, 1)), index=index, columns=columns)
+    return avg_df, std_df
+
+def binary_effects(df, key, condition, metrics):
+    # Same comparison as `binary_mean_diff`, for every entity of `key` and every metric in one grouped aggregation.
+    # Returns a tidy frame: key, metric, mean of the positive (== 1) and negative (== 0) rows and the percent lift.
+    keys = [key] if isinstance(key, str) else list(key)
+    metrics = [metrics] if isinstance(metrics, str) else list(metrics)
+    side = df[condition].map({1: 'mean_pos', 0: 'mean_neg'}).rename('side')    # Other values are left out.
+
+    means = df.groupby(keys + [side], observed=True)[metrics].mean().unstack('side')
+    means = means.reindex(columns=pd.MultiIndex.from_product([metrics, ['mean_pos', 'mean_neg']]))
+    df_effect = means.stack(level=0, future_stack=True).rename_axis(keys + ['metric']).reset_index()
+    df_effect.columns.name = None
+
+    df_effect['pct_diff'] = (df_effect['mean_pos'] - df_effect['mean_neg']) / df_effect['mean_neg'] * 100
+    return df_effect
 
 def binary_mean_diff(df, condition, mode):
     mean_pos_sales = df.loc[df[condition] == 1, 'net_units'].mean() if mode=='sales' or mode=='both' else 0
@@ -61,15 +86,21 @@ def dfs_to_df(dfs, cat, index_name=None):
     df_group = pd.concat(dfs, names=[cat]).reset_index(level=0).reset_index(drop=True)
     return df_group
 
-def dtm(date):
-    date = date.astype(str)
-    date = date.str.replace(r'-\d{2}$', '', regex=True)
-    return date
-
 def pad_ylim(ax, factor=1.1):
     lo, hi = ax.get_ylim()
     ax.set_ylim(lo, hi * factor)
 
+def partition(df, category):
+    # Group codes are computed once, then a single stable argsort lays every group out contiguously,
+    # so each partition is a slice (a view) of one reordered frame instead of a masked copy per group.
+    codes, items = pd.factorize(df[category], sort=True)     # Sorted items for neat visuals; missing values get -1.
+    order = np.argsort(codes, kind='stable')
+    data = df.drop(columns=category).take(order)
+    bounds = np.searchsorted(codes[order], np.arange(len(items) + 1))
+
+    parts = {item: data.iloc[start:stop] for item, start, stop in zip(items, bounds[:-1], bounds[1:])}
+    return parts
+
 def plot_bar(df, x, y, title, xlabel=None, ylabel=None, xtick1=None, xtick2=None, ax=None):
     if ax is None:
         fig, ax = plt.subplots(figsize=(5,4))
@@ -108,28 +139,28 @@ def plot_stackedbar(pivot, title, xlabel=None, ylabel=None, n_xticks=None, ax=No
     return ax
 
 def separate(df, dfs, category):
-    # Sort data first for neat visuals.
-    df = df.sort_values(category).reset_index(drop=True)
-
-    for item in df[category].unique():
-        df_item = df[df[category] == item].drop(columns=category)
-        dfs[item] = df_item
-
-def series_group(df, category, item):
-    # Ensure the dates are sorted,
-    df = df.sort_values('date').reset_index(drop=True)
-
-    # Add column to flag group and group data.
-    df['group'] = (df[category] != df[category].shift()).cumsum()
-    df_group = (
-        df.groupby(['group', category]).agg(
-            start_date=('date', 'first'),
-            end_date=('date', 'last'),
-            total_item=(item, 'sum')
-        )
-        .reset_index()
-    )
-
-    df_group['date'] = df_group['start_date'] + ' - ' + df_group['end_date']
-    df_group = df_group[['date', category, 'total_item']]
+    dfs.update(partition(df, category))
+
+def series_group(df, category, item, by=None, date='date'):
+    # Continuous segments of dates with the same `category`, with the `item` total of each segment.
+    # `by` (a column or list of columns, e.g. 'city') segments every entity in the same call.
+    by = [] if by is None else [by] if isinstance(by, str) else list(by)
+
+    # Ensure the dates are sorted within each entity.
+    df = df.sort_values(by + [date], kind='stable')
+
+    # A segment starts wherever the entity or the category changes from the previous row.
+    change = np.zeros(len(df), dtype=bool)
+    change[:1] = True
+    for col in by + [category]:
+        codes = pd.factorize(df[col])[0]
+        change[1:] |= codes[1:] != codes[:-1]
+    starts = np.flatnonzero(change)
+    ends = np.append(starts[1:], len(df))[:len(starts)] - 1
+
+    # Start and end keep the type of `date` (no string building).
+    df_group = df[by + [category]].iloc[starts].reset_index(drop=True)
+    df_group['start_date'] = df[date].iloc[starts].reset_index(drop=True)
+    df_group['end_date'] = df[date].iloc[ends].reset_index(drop=True)
+    df_group['total_item'] = np.add.reduceat(df[item].to_numpy(), starts) if len(starts) else []
     return df_group
\ No newline at end of file
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DATA_PATH = './data/retail_sales_synthetic.csv'
+
+# Explicit schema of the raw data file, so the CSV is parsed without dtype inference.
+CAT_COLS = ['store_id', 'store_type', 'region', 'city', 'product_id', 'category']
+FLAG_COLS = ['promotion', 'is_holiday', 'weekend', 'online']
+DTYPES = {
+    **{col: 'category' for col in CAT_COLS},
+    **{col: 'int8' for col in FLAG_COLS},
+    'store_area_sqft': 'int64',
+    'base_price': 'float64',
+    'final_price': 'float64',
+    'discount_pct': 'float64',
+    'day_of_week': 'int64',
+    'units_sold': 'int64',
+    'returns': 'int64',
+    'net_units': 'int64',
+    'revenue': 'float64',
+    'net_revenue': 'float64',
+    'avg_rating': 'float64',
+}
+DATE_FORMAT = '%Y-%m-%d'
+
+# Any change to the schema above invalidates the existing caches.
+SCHEMA_VERSION = hashlib.sha1(json.dumps([DTYPES, DATE_FORMAT], sort_keys=True).encode()).hexdigest()[:12]
+
+def cache_paths(path, cache_dir=None):
+    # By default, caches are kept next to the source file (e.g. `./data/.cache/`).
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(path) or '.', '.cache')
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, stem + '.parquet'), os.path.join(cache_dir, stem + '.json')
+
+def parse_csv(path=DATA_PATH):
+    df = pd.read_csv(
+        path,
+        dtype=DTYPES,
+        parse_dates=['date'],
+        date_format=DATE_FORMAT,
+        engine='pyarrow'
+    )
+    return df
+
+def dataset_files(path):
+    # Parquet files of a partitioned dataset directory (e.g. written by `synth.py`), in a stable order.
+    files = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names if name.endswith('.parquet')]
+    return sorted(files)
+
+def read_dataset(path, columns=None):
+    # A partitioned Parquet dataset with the same dtypes as the parsed CSV.
+    df = ds.dataset(dataset_files(path), format='parquet').to_table(columns=columns).to_pandas()
+    return with_dtypes(df)
+
+def with_dtypes(df):
+    # Categories come out sorted, like the categories the CSV parser infers.
+    return df.astype({col: dtype for col, dtype in DTYPES.items() if col in df.columns})
+
+def source_signature(path):
+    # The cache is valid as long as the source file (or the files of a dataset directory) and the schema are unchanged.
+    stats = [os.stat(file) for file in (dataset_files(path) if os.path.isdir(path) else [path])]
+    signature = {
+        'source': os.path.abspath(path),
+        'size': sum(stat.st_size for stat in stats),
+        'mtime_ns': max((stat.st_mtime_ns for stat in stats), default=0),
+        'schema': SCHEMA_VERSION
+    }
+    return signature
+
+def valid_cache(path, cache_dir=None):
+    # Path of the Parquet cache of `path` if it is up to date, else None.
+    cache_path, meta_path = cache_paths(path, cache_dir)
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            try:
+                signature = json.load(f)
+            except ValueError:
+                return None     # Unreadable metadata (e.g. written by an interrupted run): parse again.
+        if signature == source_signature(path):
+            return cache_path
+    return None
+
+def read_sales(path=DATA_PATH, cache_dir=None, refresh=False):
+    # A dataset directory is already Parquet, so it is read as is.
+    if os.path.isdir(path):
+        return read_dataset(path)
+
+    cache_path = None if refresh else valid_cache(path, cache_dir)
+    if cache_path is not None:
+        return pd.read_parquet(cache_path)
+
+    # Taken before parsing, so a file replaced during the parse leaves a cache that no longer matches it.
+    signature = source_signature(path)
+    df = parse_csv(path)
+
+    # Write to temporary files first so an interrupted run never leaves a broken cache.
+    cache_path, meta_path = cache_paths(path, cache_dir)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    df.to_parquet(cache_path + '.tmp', index=False)
+    os.replace(cache_path + '.tmp', cache_path)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(signature, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return df
+
+def iter_sales(path=DATA_PATH, columns=None, chunksize=1_000_000, cache_dir=None):
+    # Stream the data in chunks of at most `chunksize` rows without loading the whole file:
+    # batches of the Parquet cache when it is up to date, otherwise chunks of the CSV itself (the cache is not built).
+    # Categorical columns only know the categories of their own chunk.
+    if os.path.isdir(path):
+        for batch in ds.dataset(dataset_files(path), format='parquet').to_batches(columns=columns, batch_size=chunksize, batch_readahead=1, fragment_readahead=1):
+            yield with_dtypes(batch.to_pandas())
+        return
+
+    cache_path = valid_cache(path, cache_dir)
+    if cache_path is not None:
+        for batch in pq.ParquetFile(cache_path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    reader = pd.read_csv(
+        path,
+        usecols=columns,
+        dtype={col: dtype for col, dtype in DTYPES.items() if columns is None or col in columns},
+        parse_dates=['date'] if columns is None or 'date' in columns else False,
+        date_format=DATE_FORMAT,
+        chunksize=chunksize
+    )
+    with reader:
+        yield from reader
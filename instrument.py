@@ -0,0 +1,103 @@
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+
+# Stage-level instrumentation: wrap each stage of a run in `tracer.stage(name)` (or decorate it with `tracer.timed()`)
+# to record its wall and CPU time, the peak and net Python/numpy allocations (tracemalloc) and the growth of the
+# process's peak RSS. Stages can be nested; a parent's allocation peak includes its children.
+# `tracer.save(path)` writes the run as a JSON trace and `tracer.summary()` gives it as a table.
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+def optimizer_stats(result):
+    # Optimizer statistics of a fitted statsmodels model (e.g. SARIMAX), from its `mle_retvals`.
+    retvals = getattr(result, 'mle_retvals', None) or {}
+    count = lambda key: None if retvals.get(key) is None else int(retvals[key])
+    stats = {
+        'converged': bool(retvals.get('converged', False)),
+        'iterations': count('iterations'),
+        'fcalls': count('fcalls'),
+        'warnflag': count('warnflag'),
+        'llf': float(result.llf)
+    }
+    return stats
+
+class Tracer:
+    def __init__(self, run=None, trace_memory=True):
+        self.run = run
+        self.trace_memory = trace_memory    # Tracing allocations slows allocation-heavy stages down.
+        self.started = pd.Timestamp.now().isoformat(timespec='seconds')
+        self.spans = []
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name, **info):
+        # Yields the stage's record, so the stage can add its own fields (e.g. `span.update(optimizer_stats(result))`).
+        span = {'stage': name, 'parent': self._stack[-1]['stage'] if self._stack else None, **info}
+        tracing = self.trace_memory
+        if tracing and not self._stack:
+            tracemalloc.start()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # Keep the parent's peak so far before the peak is reset for this stage.
+                self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+            tracemalloc.reset_peak()
+            span['_start'], span['_peak'] = current, current
+
+        rss = peak_rss_mb()
+        wall, cpu = time.perf_counter(), time.process_time()
+        self._stack.append(span)
+        try:
+            yield span
+        finally:
+            span['wall_s'] = time.perf_counter() - wall
+            span['cpu_s'] = time.process_time() - cpu
+            self._stack.pop()
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, span.pop('_peak'))
+                start = span.pop('_start')
+                span['alloc_peak_mb'] = (peak - start) / 2**20
+                span['alloc_net_mb'] = (current - start) / 2**20
+                if self._stack:
+                    self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+                    tracemalloc.reset_peak()
+                else:
+                    tracemalloc.stop()
+            span['peak_rss_mb'] = peak_rss_mb()
+            span['rss_growth_mb'] = span['peak_rss_mb'] - rss
+            self.spans.append(span)
+
+    def timed(self, name=None):
+        # Decorator form of `stage`.
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        # One row per stage run, in the order the stages finished (children before their parent).
+        df_summary = pd.DataFrame(self.spans)
+        first = ['stage', 'parent', 'wall_s', 'cpu_s', 'alloc_peak_mb', 'alloc_net_mb', 'peak_rss_mb', 'rss_growth_mb']
+        return df_summary[[c for c in first if c in df_summary] + [c for c in df_summary if c not in first]]
+
+    def save(self, path):
+        trace = {'run': self.run, 'started': self.started, 'pid': os.getpid(), 'stages': self.spans}
+        # Write to a temporary file first so an interrupted run never leaves a broken trace.
+        with open(path + '.tmp', 'w') as f:
+            json.dump(trace, f, indent=1, default=str)
+        os.replace(path + '.tmp', path)
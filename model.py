@@ -0,0 +1,36 @@
+import numpy as np
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+y_cols = ['net_units', 'net_revenue']                           # Endogenous variables.
+p_cols = ['promotion', 'is_holiday', 'weekend', 'discount_pct'] # Exogenous variables.
+
+# Hand-tuned orders of each target (see the tuning process in `forecast.py`).
+SPECS = {
+    'net_units': {'order': (1,1,0), 'seasonal_order': (0,1,1,12)},
+    'net_revenue': {'order': (1,0,1), 'seasonal_order': (0,1,1,12)},
+}
+
+def build_sarimax(y, X, order, seasonal_order):
+    # Targets are modelled in log space, exactly like the company-wide models.
+    model = SARIMAX(
+        endog=np.log1p(y),
+        exog=X,
+        order=order,
+        seasonal_order=seasonal_order,
+        enforce_stationarity=False,
+        enforce_invertibility=False
+    )
+    return model
+
+def fit_sarimax(y, X, order, seasonal_order, start_params=None, maxiter=50):
+    # `start_params` (e.g. from a fit on a shorter sample) are only used when they beat the default start values.
+    model = build_sarimax(y, X, order, seasonal_order)
+    return model.fit(start_params=warm_start(model, start_params), maxiter=maxiter, disp=False)
+
+def warm_start(model, params):
+    # Use `params` (e.g. from a previous fit) as start values only if they beat the model's default start values.
+    if params is None or len(params) != len(model.start_params):
+        return None
+    if not model.loglike(params) >= model.loglike(model.start_params):
+        return None
+    return params
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from fleet import SERIES_KEYS
+
+# Hierarchical reconciliation of forecasts made independently at every level of the sales hierarchy:
+# store/product series (the bottom level) -> store -> city -> region -> company total, and product -> category -> total.
+# Base forecasts of the levels do not add up; reconciliation adjusts them so that every aggregate equals the sum of
+# its bottom series (bottom-up, OLS or MinT with a shrunk residual covariance).
+# Everything is sparse or low rank: the summing matrix S = [A; I] is stored as its sparse aggregation part A, and the
+# reconciled forecasts are computed in the constraint form
+#     y~ = y^ - W C' (C W C')^-1 C y^,   C = [I, -A],
+# which is the usual S (S' W^-1 S)^-1 S' W^-1 y^ but only solves a sparse system of the size of the aggregates.
+# W is diagonal plus the low rank sample covariance of the residuals, so no dense (series x series) matrix is ever built.
+LEVELS = {
+    'total': [],
+    'region': ['region'],
+    'city': ['region', 'city'],
+    'store': ['region', 'city', 'store_id'],
+    'category': ['category'],
+    'product': ['category', 'product_id']
+}
+METHODS = ['bottom_up', 'ols', 'mint_shrink']
+
+def bottom_series(df, keys=SERIES_KEYS, attrs=('region', 'city', 'category')):
+    # One row per bottom series with the attributes its aggregates are grouped by.
+    return df[list(keys) + list(attrs)].drop_duplicates(keys).sort_values(keys).reset_index(drop=True)
+
+class Hierarchy:
+    def __init__(self, bottom, levels=LEVELS, keys=SERIES_KEYS):
+        self.bottom = bottom
+        n_bottom = len(bottom)
+        blocks, index = [], []
+        for level, by in levels.items():
+            if by:
+                codes, labels = pd.MultiIndex.from_frame(bottom[by]).factorize(sort=True)
+                labels = list(labels)
+            else:
+                codes, labels = np.zeros(n_bottom, dtype=int), [()]
+            blocks.append(sparse.csr_matrix((np.ones(n_bottom), (codes, np.arange(n_bottom))), shape=(len(labels), n_bottom)))
+            index += [(level, label) for label in labels]
+        self.A = sparse.vstack(blocks, format='csr')        # (aggregates x bottom series)
+        self.keys = list(bottom[keys].itertuples(index=False, name=None))     # Bottom series, in the column order of A.
+        index += [('bottom', key) for key in self.keys]
+        # Aggregates first, then the bottom series, like the rows of S.
+        self.index = pd.MultiIndex.from_tuples(index, names=['level', 'key'])
+        self.n_aggregates = self.A.shape[0]
+
+    @property
+    def S(self):
+        return sparse.vstack([self.A, sparse.identity(self.A.shape[1], format='csr')], format='csr')
+
+    def aggregate(self, y_bottom):
+        # Every series of the hierarchy (rows of `index`) from the bottom series (e.g. actuals or bottom-up forecasts),
+        # an array in the order of `keys` or a frame indexed by them.
+        if isinstance(y_bottom, pd.DataFrame):
+            y_bottom = y_bottom.reindex(pd.MultiIndex.from_tuples(self.keys))
+        y_bottom = np.asarray(y_bottom, dtype=float)
+        return np.concatenate([self.A @ y_bottom, y_bottom])
+
+def shrink_lambda(residuals):
+    # Shrinkage intensity of the residual correlations towards 0 (Schäfer & Strimmer, as in MinT-shrink),
+    # from the (periods x series) residuals. The sums over all pairs of series are rewritten as sums over
+    # periods, so this is O(periods^2 x series) instead of O(series^2).
+    T = len(residuals)
+    sd = np.sqrt((residuals ** 2).mean(axis=0))
+    x = residuals / np.where(sd > 0, sd, 1)
+    x2 = x ** 2
+    gram = x @ x.T                                              # (periods x periods)
+    sum_corr2 = ((gram ** 2).sum() - (x2.sum(axis=0) ** 2).sum()) / T ** 2
+    sum_x2x2 = (x2.sum(axis=1) ** 2).sum() - (x2 ** 2).sum()
+    sum_var = (sum_x2x2 - T * sum_corr2) / (T * (T - 1))
+    return float(np.clip(sum_var / sum_corr2, 0, 1)) if sum_corr2 > 0 else 1.0
+
+def mint_shrink_cov(residuals):
+    # W = lambda * diag(sigma) + (1 - lambda) * sigma of the in-sample residuals (periods x series, every series
+    # of the hierarchy), as a diagonal and a low rank factor U (series x periods) with W = diag(d) + U U'.
+    T = len(residuals)
+    lam = shrink_lambda(residuals)
+    variance = (residuals ** 2).mean(axis=0)
+    # A series without residual variance (e.g. all zero) would make W singular.
+    floor = 1e-9 * max(variance.mean(), 1e-12)
+    d = np.maximum(lam * variance, floor)
+    U = np.sqrt((1 - lam) / T) * residuals.T
+    return d, U, lam
+
+def project(hier, y_hat, d, U=None):
+    # y~ = y^ - W C' (C W C')^-1 C y^ with W = diag(d) + U U'. C W C' = K + V V' with sparse K = diag(d_a) + A diag(d_b) A'
+    # and V = C U; its inverse is applied with a sparse LU of K and the Woodbury identity.
+    A, n_a = hier.A, hier.n_aggregates
+    C = lambda y: y[:n_a] - A @ y[n_a:]
+    Ct = lambda z: np.concatenate([z, -(A.T @ z)])
+    K = (sparse.diags(d[:n_a]) + A @ sparse.diags(d[n_a:]) @ A.T).tocsc()
+    lu = splu(K)
+    z = lu.solve(C(y_hat))
+    if U is not None:
+        V = C(U)                                                # (aggregates x periods)
+        KV = lu.solve(V)
+        z = z - KV @ np.linalg.solve(np.eye(V.shape[1]) + V.T @ KV, V.T @ z)
+    Ctz = Ct(z)
+    WCtz = d[:, None] * Ctz if Ctz.ndim > 1 else d * Ctz
+    if U is not None:
+        WCtz = WCtz + U @ (U.T @ Ctz)
+    return y_hat - WCtz
+
+def reconcile(hier, y_hat, method='mint_shrink', residuals=None):
+    # Coherent forecasts of every series of `hier` from their base forecasts `y_hat` (series x steps, or a frame with
+    # `hier.index`). `residuals` (periods x series, or a frame with `hier.index` as columns) are the in-sample one-step
+    # errors of the base models, needed by 'mint_shrink'.
+    frame = isinstance(y_hat, (pd.DataFrame, pd.Series))
+    if frame:
+        y_hat = y_hat.reindex(hier.index)
+        columns = y_hat.columns if isinstance(y_hat, pd.DataFrame) else None
+    values = np.asarray(y_hat, dtype=float)
+    if np.isnan(values).any():
+        raise ValueError('Every series of the hierarchy needs a base forecast.')
+
+    n_series = len(hier.index)
+    if method == 'bottom_up':
+        y_rec = hier.aggregate(values[hier.n_aggregates:])
+    elif method == 'ols':
+        y_rec = project(hier, values, np.ones(n_series))
+    elif method == 'mint_shrink':
+        if residuals is None:
+            raise ValueError("'mint_shrink' needs the in-sample residuals of the base forecasts.")
+        if isinstance(residuals, pd.DataFrame):
+            residuals = residuals.reindex(columns=hier.index)
+        residuals = np.asarray(residuals, dtype=float)
+        d, U, _ = mint_shrink_cov(residuals[~np.isnan(residuals).any(axis=1)])
+        y_rec = project(hier, values, d, U)
+    else:
+        raise ValueError(f"Unknown reconciliation method '{method}'; use one of {METHODS}.")
+
+    if not frame:
+        return y_rec
+    if columns is None:
+        return pd.Series(y_rec, index=hier.index)
+    return pd.DataFrame(y_rec, index=hier.index, columns=columns)
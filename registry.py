@@ -0,0 +1,268 @@
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import joblib
+
+from artifact import FORMAT_VERSION, CompactSARIMAX, convert_results
+
+# Registry of saved models keyed by (target, store_id, product_id, version).
+# A small JSON manifest lists every model file (company-wide models have no store/product); it is all that is read at
+# startup. Each model is loaded on first use only and kept in a size-bounded LRU cache, so a fleet of thousands of
+# per-series models is served without loading them all up front or reloading them on every request.
+# The version of a model is the digest of its file, so a file changed after the manifest was written (e.g. by
+# `retrain.py`) is detected on load instead of silently served under the old version; the registry then re-reads
+# the manifest.
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 1
+
+def file_digest(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+def manifest_entry(path, root, target, store_id=None, product_id=None):
+    with open(path, 'rb') as f:
+        data = f.read()
+    entry = {
+        'target': target,
+        'store_id': store_id,
+        'product_id': product_id,
+        'version': file_digest(data),
+        'path': os.path.relpath(path, root),
+        'bytes': len(data),
+        'created': os.path.getmtime(path)
+    }
+    return entry
+
+def build_manifest(model_dir='.', fleet_dir=None, root=None):
+    # Manifest of the company-wide models (`model_<target>.joblib` in `model_dir`) and of a fleet
+    # (`<fleet_dir>/<store_id>/<product_id>/model_<target>.joblib`, see `fleet.py`).
+    # Paths are relative to `root`, the directory of the manifest file (`model_dir` by default).
+    root = model_dir if root is None else root
+    entries = []
+    for path in sorted(glob.glob(os.path.join(model_dir, 'model_*.joblib'))):
+        entries.append(manifest_entry(path, root, os.path.basename(path)[len('model_'):-len('.joblib')]))
+    if fleet_dir is not None:
+        for path in sorted(glob.glob(os.path.join(fleet_dir, '*', '*', 'model_*.joblib'))):
+            store_id, product_id, name = os.path.relpath(path, fleet_dir).split(os.sep)
+            entries.append(manifest_entry(path, root, name[len('model_'):-len('.joblib')], store_id, product_id))
+    return {'manifest_version': MANIFEST_VERSION, 'models': entries}
+
+def write_manifest(manifest, path):
+    # Write to a temporary file first so an interrupted run never leaves a broken manifest.
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+def read_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('manifest_version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version in '{path}': {manifest.get('manifest_version')}.")
+    return manifest
+
+def refresh_manifest(path):
+    # Rewrite an existing manifest with the current version of each of its files (e.g. after `retrain.py` updated
+    # them in place); entries of deleted files are dropped. Does nothing without a manifest.
+    if not os.path.exists(path):
+        return None
+    root = os.path.dirname(path) or '.'
+    entries = []
+    for entry in read_manifest(path)['models']:
+        file_path = os.path.join(root, entry['path'])
+        if os.path.exists(file_path):
+            entries.append({**entry, **manifest_entry(file_path, root, entry['target'], entry['store_id'], entry['product_id'])})
+    manifest = {'manifest_version': MANIFEST_VERSION, 'models': entries}
+    write_manifest(manifest, path)
+    return manifest
+
+class LoadError(Exception):
+    # A model listed in the manifest could not be loaded (changed or missing file, unreadable artifact):
+    # a server-side failure, unlike an unknown model.
+    pass
+
+class StaleEntry(LoadError):
+    # The file of a manifest entry changed after the manifest was written.
+    pass
+
+def load_entry(entry, root):
+    # Compact artifact of a manifest entry, checked against its recorded version. Entries of legacy full results
+    # pickles (`SARIMAXResults.save`) name their `joblib` scaler in `scaler` and are converted on load.
+    path = os.path.join(root, entry['path'])
+    with open(path, 'rb') as f:
+        data = f.read()
+    if file_digest(data) != entry['version']:
+        raise StaleEntry(f"'{path}' changed after the manifest was written; rebuild the manifest.")
+    if entry.get('scaler') is not None:
+        return CompactSARIMAX(convert_results(path, os.path.join(root, entry['scaler']), entry['target']))
+    artifact = joblib.load(io.BytesIO(data))
+    if artifact.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format version in '{path}': {artifact.get('format_version')}.")
+    return CompactSARIMAX(artifact)
+
+def index_entries(manifest):
+    # Manifest entries by full key, and the version of the most recent file of each (target, store_id, product_id).
+    entries, latest = {}, {}
+    for entry in manifest['models']:
+        series = (entry['target'], entry['store_id'], entry['product_id'])
+        entries[series + (entry['version'],)] = entry
+        if series not in latest or entry['created'] > entries[series + (latest[series],)]['created']:
+            latest[series] = entry['version']
+    return entries, latest
+
+class ModelRegistry:
+    def __init__(self, manifest, root=None, max_models=1024, factory=None, on_evict=None, check_interval=2.0):
+        # `manifest` is a manifest dict or the path of a manifest file (whose directory is then the default `root`).
+        # `factory` wraps each loaded model before it is cached (e.g. in a `serve.Batcher`); `on_evict` is called with
+        # the cached object when the LRU drops it.
+        # A manifest file is re-read when it changes on disk (checked at most every `check_interval` seconds) or when
+        # a model file no longer matches its entry, so models updated in place (e.g. by `retrain.py`, which refreshes
+        # the manifest) are served in their new version without a restart.
+        self.manifest_path = manifest if isinstance(manifest, str) else None
+        if self.manifest_path is not None:
+            root = os.path.dirname(manifest) if root is None else root
+            self.manifest_mtime = os.path.getmtime(manifest)
+            manifest = read_manifest(manifest)
+        self.root = root or '.'
+        self.max_models = max_models
+        self.factory = factory
+        self.on_evict = on_evict
+        self.check_interval = check_interval
+        self.checked = time.monotonic()
+        self.entries, self.latest = index_entries(manifest)
+
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.loading = {}       # One lock per key being loaded, so concurrent misses of a key load it once.
+        self.hits = self.misses = self.evictions = self.loads = self.load_errors = self.reloads = 0
+        self.load_seconds = 0.0
+
+    def reload(self):
+        # Re-read the manifest file. Cached models whose version is no longer listed are evicted.
+        if self.manifest_path is None:
+            return False
+        mtime = os.path.getmtime(self.manifest_path)
+        entries, latest = index_entries(read_manifest(self.manifest_path))
+        evicted = []
+        with self.lock:
+            self.entries, self.latest = entries, latest
+            self.manifest_mtime = mtime
+            self.reloads += 1
+            for key in [key for key in self.cache if key not in entries]:
+                evicted.append(self.cache.pop(key))
+                self.evictions += 1
+        if self.on_evict is not None:
+            for old in evicted:
+                self.on_evict(old)
+        return True
+
+    def check_manifest(self):
+        # Cheap periodic check of the manifest file's modification time.
+        if self.manifest_path is None or time.monotonic() - self.checked < self.check_interval:
+            return
+        self.checked = time.monotonic()
+        try:
+            changed = os.path.getmtime(self.manifest_path) != self.manifest_mtime
+        except OSError:
+            return      # Being replaced; the next check picks up the new file.
+        if changed:
+            self.reload()
+
+    def resolve(self, target, store_id=None, product_id=None, version=None):
+        # Full registry key of a model; the latest version unless one is given.
+        series = (target, store_id, product_id)
+        with self.lock:
+            version = self.latest.get(series) if version is None else version
+            key = series + (version,)
+            if key not in self.entries:
+                raise KeyError(key if version is not None else series)
+            return key, self.entries[key]
+
+    def get(self, target, store_id=None, product_id=None, version=None):
+        self.check_manifest()
+        try:
+            return self._get(*self.resolve(target, store_id, product_id, version))
+        except StaleEntry:
+            # The file was updated after the manifest was read: pick up the refreshed manifest and try once more.
+            if not self.reload():
+                raise
+            return self._get(*self.resolve(target, store_id, product_id, version))
+
+    def _get(self, key, entry):
+        with self.lock:
+            if key in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            self.misses += 1
+            key_lock = self.loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                # Loaded by a concurrent request in the meantime.
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    return self.cache[key]
+            start = time.perf_counter()
+            try:
+                item = load_entry(entry, self.root)
+                item = self.factory(item) if self.factory is not None else item
+            except Exception as e:
+                with self.lock:
+                    self.load_errors += 1
+                    self.loading.pop(key, None)
+                if isinstance(e, LoadError):
+                    raise
+                raise LoadError(f'Could not load model {key}: {e!r}') from e
+
+            evicted = []
+            with self.lock:
+                self.loads += 1
+                self.load_seconds += time.perf_counter() - start
+                self.loading.pop(key, None)
+                self.cache[key] = item
+                while len(self.cache) > self.max_models:
+                    evicted.append(self.cache.popitem(last=False)[1])
+                    self.evictions += 1
+        if self.on_evict is not None:
+            for old in evicted:
+                self.on_evict(old)
+        return item
+
+    def models(self):
+        # Manifest entries of every model, without loading any.
+        return list(self.entries.values())
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'models': len(self.entries),
+                'cached': len(self.cache),
+                'max_models': self.max_models,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'loads': self.loads,
+                'load_errors': self.load_errors,
+                'reloads': self.reloads,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'avg_load_ms': self.load_seconds / self.loads * 1000 if self.loads else None
+            }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the manifest of the saved company-wide and fleet models.')
+    parser.add_argument('--models', default='.', help="Directory with the company-wide 'model_<target>.joblib' artifacts.")
+    parser.add_argument('--fleet', default=None, help='Fleet directory (see `fleet.py`) to include.')
+    parser.add_argument('--out', default=None, help=f"Manifest path (default: '{MANIFEST}' in the models directory).")
+    args = parser.parse_args()
+
+    out = args.out or os.path.join(args.models, MANIFEST)
+    manifest = build_manifest(args.models, args.fleet, os.path.dirname(out) or '.')
+    write_manifest(manifest, out)
+    print(f"Wrote {len(manifest['models'])} models to {out}.")
@@ -0,0 +1,73 @@
+import json
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+from matplotlib.figure import Figure
+
+from stages import code_digest, fingerprint
+
+# Headless figure rendering for batch reports.
+# A figure is given as name -> (draw, data, options): `draw(fig, data, **options)` draws on a fresh Agg figure.
+# Each output file is keyed by a hash of the draw code, its data (e.g. the pivot it plots), its options and the format,
+# and the keys are kept in a manifest next to the figures, so figures whose inputs did not change are skipped.
+MANIFEST = 'render_manifest.json'
+FORMATS = ('png',)
+
+def render(draw, data, options, paths):
+    # Render one figure to every path (the format follows the extension). Runs in the worker processes.
+    matplotlib.use('Agg')
+    fig = Figure(figsize=options.pop('figsize', (10,4)))
+    draw(fig, data, **options)
+    for path in paths:
+        fig.savefig(path + '.tmp', format=os.path.splitext(path)[1][1:], bbox_inches='tight')
+        os.replace(path + '.tmp', path)
+    return paths
+
+def render_pool(n_jobs):
+    # Workers are spawned so each starts with a clean matplotlib state, and switch to the Agg backend on start-up.
+    # The backend of the calling process is left alone.
+    return ProcessPoolExecutor(max_workers=n_jobs, mp_context=mp.get_context('spawn'), initializer=matplotlib.use, initargs=('Agg',))
+
+def render_figures(figures, out_dir, formats=FORMATS, n_jobs=None):
+    # Render the figures whose key changed (or whose file is missing) and return the names of the rendered ones.
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    codes = {}
+    pending = {}
+    for name, (draw, data, options) in figures.items():
+        if draw not in codes:
+            codes[draw] = code_digest(draw)
+        paths, keys = [], {}
+        for fmt in formats:
+            file = f'{name}.{fmt}'
+            keys[file] = fingerprint(codes[draw], data, options, fmt)
+            if manifest.get(file) != keys[file] or not os.path.exists(os.path.join(out_dir, file)):
+                paths.append(os.path.join(out_dir, file))
+        if paths:
+            pending[name] = (draw, data, dict(options), paths, keys)
+
+    # Keys are recorded only for the figures that were written, so a failed or interrupted run re-renders the rest.
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(pending))
+    try:
+        if n_jobs <= 1:
+            for draw, data, options, paths, keys in pending.values():
+                render(draw, data, options, paths)
+                manifest.update(keys)
+        else:
+            with render_pool(n_jobs) as pool:
+                futures = {name: pool.submit(render, draw, data, options, paths) for name, (draw, data, options, paths, _) in pending.items()}
+                for name, future in futures.items():
+                    future.result()
+                    manifest.update(pending[name][-1])
+    finally:
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(manifest_path + '.tmp', manifest_path)
+    return list(pending)
@@ -0,0 +1,150 @@
+import argparse
+import os
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from aggregate import monthly
+from artifact import CompactSARIMAX, load_artifact, spec_kwargs, to_artifact
+from fleet import series_dir, series_frames
+from ingest import DATA_PATH, read_sales
+from model import warm_start, y_cols
+from registry import MANIFEST, refresh_manifest
+
+def update_model(model, y_new, X_new, history=None, refit_every=None, last_period=None, maxiter=50):
+    # Monthly update of a saved model without refitting from scratch.
+    # The newly closed months (raw endog `y_new` and raw exog `X_new`) are scaled with the stored scaler
+    # and filtered in from the stored state, keeping the parameters fixed.
+    # Every `refit_every` months, the parameters are re-estimated on the full `history` (y, X),
+    # warm-started from the current ones so fewer optimizer iterations are needed.
+    y_new = np.log1p(np.asarray(y_new, dtype=float))
+    X_new = model.scale(pd.DataFrame(X_new, columns=model.exog_names)).values
+    n_new = len(y_new)
+
+    updates = model.artifact.get('updates_since_fit', 0) + n_new
+    if refit_every is not None and updates >= refit_every:
+        if history is None:
+            raise ValueError('The full history (y, X) is needed to re-estimate the parameters.')
+        y_hist, X_hist = history
+        if len(y_hist) != model.nobs + n_new:
+            raise ValueError(f'The history has {len(y_hist)} months but the updated model covers {model.nobs + n_new}.')
+
+        # The stored scaler is kept (not refitted), so the warm start parameters stay on the same scale.
+        kwargs = spec_kwargs(model.spec)
+        kwargs['trend_offset'] -= model.nobs
+        refit = SARIMAX(
+            endog=np.log1p(np.asarray(y_hist, dtype=float)),
+            # A frame, so the refit model keeps the exog names its scaler and requests use.
+            exog=model.scale(pd.DataFrame(X_hist, columns=model.exog_names)),
+            **kwargs
+        )
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            # Fall back to the default start values if the new months made the current parameters a worse starting point.
+            start_params = warm_start(refit, model.params.values)
+            result = refit.fit(start_params=start_params, maxiter=maxiter, disp=False)
+        artifact = to_artifact(result, model.scaler, model.target, last_period)
+    else:
+        index = pd.RangeIndex(model.nobs, model.nobs + n_new)
+        extension = model.build(pd.Series(y_new, index=index), pd.DataFrame(X_new, index=index, columns=model.exog_names))
+        result = extension.filter(model.params.values)
+        artifact = to_artifact(result, model.scaler, model.target, last_period, updates)
+        artifact['nobs'] = model.nobs + n_new
+
+    return CompactSARIMAX(artifact), result
+
+def last_closed_month(dates, as_of=None):
+    # End of the last complete month of an extract: the month of its last day if that day is a month end, else the
+    # month before. An extract cut on 3 July ends in July, but July is still in progress and only June is closed.
+    # `as_of` is the day the extract was cut, if known (its last day otherwise).
+    last = pd.Timestamp(dates.max() if as_of is None else as_of).normalize()
+    month_end = last + pd.offsets.MonthEnd(0)
+    return month_end if last == month_end else last - pd.offsets.MonthEnd(1)
+
+def update_from_monthly(model, df_monthly, refit_every=None, maxiter=50, closed_through=None):
+    # Update a model with every closed month of `df_monthly` (a frame from `aggregate.monthly`) after its last
+    # observed month. Months ending after `closed_through` (see `last_closed_month`) are partial: they are left out,
+    # so their complete values are filtered in by a later update instead of the partial sums.
+    if model.last_period is None:
+        raise ValueError('The model has no recorded last period; use `update_model` with the new months directly.')
+    if closed_through is not None:
+        df_monthly = df_monthly[df_monthly['date'] <= closed_through]
+    df_new = df_monthly[df_monthly['date'] > model.last_period]
+    if df_new.empty:
+        return model, None
+
+    df_hist = df_monthly[df_monthly['date'] <= df_new['date'].max()]
+    return update_model(
+        model,
+        df_new[model.target], df_new[model.exog_names],
+        history=(df_hist[model.target], df_hist[model.exog_names]),
+        refit_every=refit_every,
+        last_period=df_new['date'].max(),
+        maxiter=maxiter
+    )
+
+def update_file(path, df_monthly, refit_every=None, closed_through=None):
+    # Update a saved artifact in place (written to a temporary file first so a failure never leaves a broken one).
+    model = load_artifact(path)
+    updated, result = update_from_monthly(model, df_monthly, refit_every, closed_through=closed_through)
+    if result is not None:
+        joblib.dump(updated.artifact, path + '.tmp')
+        os.replace(path + '.tmp', path)
+    report = {
+        'new_months': updated.nobs - model.nobs,
+        'last_period': updated.last_period,
+        'refitted': result is not None and updated.artifact['updates_since_fit'] == 0
+    }
+    return report
+
+def update_models(df, model_dir='.', refit_every=None, as_of=None):
+    # Update the company-wide models (`model_<target>.joblib`) with the closed months of the daily data `df`.
+    df_monthly = monthly(df)
+    closed_through = last_closed_month(df['date'], as_of)
+    reports = []
+    for y_col in y_cols:
+        path = os.path.join(model_dir, f'model_{y_col}.joblib')
+        reports.append({'target': y_col, **update_file(path, df_monthly, refit_every, closed_through)})
+    # The updated files have new versions in the registry manifest.
+    refresh_manifest(os.path.join(model_dir, MANIFEST))
+    return pd.DataFrame(reports)
+
+def update_fleet(df, out_dir='./fleet', refit_every=None, as_of=None):
+    # Update every per-series model of a fleet (see `fleet.py`). Each update is a cheap filter extension,
+    # so the fleet is walked serially; failures are reported per series like in fleet training.
+    # Months are closed by the extract as a whole, not by the last sale of each series.
+    closed_through = last_closed_month(df['date'], as_of)
+    reports = []
+    for key, frame in series_frames(df).items():
+        for y_col in y_cols:
+            path = os.path.join(series_dir(out_dir, key), f'model_{y_col}.joblib')
+            report = {'key': key, 'target': y_col, 'status': 'ok', 'error': None}
+            if not os.path.exists(path):
+                # New series have no model yet; they are picked up by the next fleet training.
+                reports.append({**report, 'status': 'missing'})
+                continue
+            try:
+                report.update(update_file(path, frame, refit_every, closed_through))
+            except Exception as e:
+                report.update(status='failed', error=repr(e))
+            reports.append(report)
+    refresh_manifest(os.path.join(out_dir, MANIFEST))
+    return pd.DataFrame(reports)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Filter newly closed months into the saved SARIMAX models.')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--models', default='.', help="Directory with the company-wide 'model_<target>.joblib' artifacts.")
+    parser.add_argument('--fleet', default=None, help='Update the per-series fleet in this directory instead.')
+    parser.add_argument('--refit-every', type=int, default=None, help='Re-estimate the parameters every N new months (default: never).')
+    parser.add_argument('--as-of', default=None, help='Day the extract was cut (default: its last day); only months closed by then are filtered in.')
+    args = parser.parse_args()
+
+    df = read_sales(args.data)
+    if args.fleet:
+        print(update_fleet(df, args.fleet, args.refit_every, args.as_of))
+    else:
+        print(update_models(df, args.models, args.refit_every, args.as_of))
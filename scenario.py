@@ -0,0 +1,67 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+def exog_frame(model, exog):
+    # Exog rows in the model's exog column order: frames are reordered by name, arrays must already be in that order.
+    if isinstance(exog, pd.DataFrame):
+        missing = [col for col in model.exog_names if col not in exog.columns]
+        if missing:
+            raise ValueError(f'The exog rows have no values for {missing}.')
+        return exog[model.exog_names]
+    return pd.DataFrame(np.asarray(exog, dtype=float).reshape(len(exog), -1), columns=model.exog_names)
+
+def exog_tensor(model, scenarios):
+    # Scenario tensor (n_scenarios, h, n_exog) whose last axis must follow `model.exog_names`.
+    if isinstance(scenarios, pd.DataFrame):
+        scenarios = exog_frame(model, scenarios).values
+    scenarios = np.asarray(scenarios, dtype=float)
+    if scenarios.shape[-1] != len(model.exog_names):
+        raise ValueError(f'Scenarios have {scenarios.shape[-1]} exog columns but the model uses {model.exog_names}.')
+    return scenarios
+
+def scenario_grid(model, base_exog, sweeps):
+    # Build every combination of the swept exog values (e.g. {'promotion': [...], 'discount_pct': [...]})
+    # on top of the base exog rows of the next `h` months. A swept column takes its value in every month.
+    # The tensor's last axis follows `model.exog_names`, whatever the column order of `base_exog`
+    # (scaling and the forecast use that order).
+    base_exog = exog_frame(model, base_exog)
+    cols = list(sweeps)
+    unknown = [col for col in cols if col not in model.exog_names]
+    if unknown:
+        raise ValueError(f'{unknown} are not exog columns of the model: {model.exog_names}.')
+    grid = pd.DataFrame(list(itertools.product(*sweeps.values())), columns=cols)
+
+    # Scenario tensor of shape (n_scenarios, h, n_exog).
+    scenarios = np.broadcast_to(base_exog.values.astype(float), (len(grid),) + base_exog.shape).copy()
+    for col in cols:
+        scenarios[:, :, base_exog.columns.get_loc(col)] = grid[col].values[:, None]
+    return grid, scenarios
+
+def scale_scenarios(model, scenarios):
+    # Standardize the whole scenario tensor in one vectorized pass with the model's scaler stats.
+    scenarios = exog_tensor(model, scenarios)
+    if model.scaler is None:
+        return scenarios
+    return (scenarios - model.scaler.mean_) / model.scaler.scale_
+
+def forecast_scenarios(model, scenarios, scaled=False, original_units=True):
+    # Given the fitted state, the SARIMAX mean forecast is linear in the exog (see `CompactSARIMAX.base_forecast`),
+    # so all scenario forecasts are one zero-exog forecast plus a single tensor-vector product.
+    scenarios = exog_tensor(model, scenarios)
+    if scenarios.ndim == 2:
+        scenarios = scenarios[None]
+    X = scenarios if scaled else scale_scenarios(model, scenarios)
+    steps = X.shape[1]
+
+    pred_log = model.base_forecast(steps)[None, :] + X @ model.exog_coefs     # (n_scenarios, h)
+    return np.expm1(pred_log) if original_units else pred_log
+
+def scenario_summary(grid, preds, months=None):
+    # Tidy frame of the scenario parameters with each month's forecast and the horizon total.
+    months = months if months is not None else [f'month_{i + 1}' for i in range(preds.shape[1])]
+    df_pred = pd.DataFrame(preds, columns=months)
+    df_summary = pd.concat([grid.reset_index(drop=True), df_pred], axis=1)
+    df_summary['total'] = preds.sum(axis=1)
+    return df_summary
@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from registry import MANIFEST, LoadError, ModelRegistry, build_manifest
+
+def load_manifest(model_dir='.', fleet_dir=None):
+    # The manifest written next to the models (see `registry.py`), or one built from the model files if there is none.
+    # Either way no model is loaded at startup: the registry loads each one on its first request.
+    path = os.path.join(model_dir, MANIFEST)
+    if fleet_dir is None and os.path.exists(path):
+        return path
+    manifest = build_manifest(model_dir, fleet_dir)
+    if not manifest['models']:
+        raise ValueError(f"No model artifacts ('model_*.joblib') found in '{model_dir}'.")
+    return manifest
+
+class Metrics:
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.latencies = deque(maxlen=window)   # Seconds of the most recent requests.
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+
+    def observe(self, seconds, ok=True):
+        with self.lock:
+            self.requests += 1
+            self.errors += 0 if ok else 1
+            self.latencies.append(seconds)
+
+    def observe_batch(self, size):
+        with self.lock:
+            self.batches += 1
+            self.batched_requests += size
+
+    def snapshot(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            uptime = time.time() - self.started
+            return {
+                'uptime_s': uptime,
+                'requests': self.requests,
+                'errors': self.errors,
+                'throughput_rps': self.requests / uptime if uptime > 0 else 0.0,
+                'batches': self.batches,
+                'avg_batch_size': self.batched_requests / self.batches if self.batches else 0.0,
+                'latency_p50_ms': float(np.percentile(latencies, 50) * 1000) if len(latencies) else None,
+                'latency_p99_ms': float(np.percentile(latencies, 99) * 1000) if len(latencies) else None
+            }
+
+class Closed(Exception):
+    # The batcher was closed after its model was evicted from the registry.
+    pass
+
+class Batcher:
+    # Groups concurrent requests for one model into a single forecast.
+    # The SARIMAX mean forecast is linear in the (scaled) exog (see `CompactSARIMAX.base_forecast`),
+    # so one zero-exog forecast serves every request of a batch, and each request only adds its own exog term.
+    # A batcher lives as long as its model stays in the registry cache; `close` stops its thread once the queued
+    # requests are served.
+    def __init__(self, model, metrics, max_batch=256, max_wait=0.002):
+        self.model = model
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.beta = model.exog_coefs
+        # Scaling is done with the stored stats directly, on the stacked exog rows of the whole batch.
+        scaler = model.scaler
+        self.mean = scaler.mean_ if scaler is not None else 0.0
+        self.scale = scaler.scale_ if scaler is not None else 1.0
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, horizon, exog):
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise Closed()
+            self.queue.put((horizon, exog, future))
+        return future
+
+    def close(self):
+        # Nothing can be queued after the stop marker (None).
+        with self.lock:
+            self.closed = True
+            self.queue.put(None)
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            batch = self._collect()
+            if batch[-1] is None:
+                stopped = True
+                batch.pop()
+                if not batch:
+                    break
+            try:
+                base = self.model.base_forecast(max(h for h, _, _ in batch))
+                X = (np.vstack([exog for _, exog, _ in batch]) - self.mean) / self.scale
+                preds = np.expm1(np.concatenate([base[:h] for h, _, _ in batch]) + X @ self.beta)
+                self.metrics.observe_batch(len(batch))
+                start = 0
+                for h, _, future in batch:
+                    future.set_result(preds[start:start + h])
+                    start += h
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+def parse_request(body, model):
+    # Exog rows can be given as objects ({'promotion': 0.1, ...}) or as lists in the model's exog column order.
+    horizon = int(body['horizon'])
+    rows = body.get('exog', [])
+    if horizon < 1 or len(rows) != horizon:
+        raise ValueError(f"'horizon' must be positive and match the number of exog rows ({len(rows)}).")
+    if rows and isinstance(rows[0], dict):
+        rows = [[row.get(col, np.nan) for col in model.exog_names] for row in rows]
+    exog = np.array(rows, dtype=float).reshape(horizon, -1)
+    if exog.shape[1] != len(model.exog_names) or np.isnan(exog).any():
+        raise ValueError(f'Every exog row needs values for {model.exog_names}.')
+    return horizon, exog
+
+class ForecastHandler(BaseHTTPRequestHandler):
+    server_version = 'ForecastServer/1.0'
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            self._send(200, {**self.server.metrics.snapshot(), 'registry': self.server.registry.stats()})
+        elif self.path == '/models':
+            # From the manifest, so listing the models does not load them.
+            self._send(200, [
+                {key: entry[key] for key in ['target', 'store_id', 'product_id', 'version']}
+                for entry in self.server.registry.models()
+            ])
+        else:
+            self._send(404, {'error': f"Unknown path '{self.path}'."})
+
+    def do_POST(self):
+        if self.path != '/forecast':
+            self._send(404, {'error': f"Unknown path '{self.path}'."})
+            return
+        start = time.perf_counter()
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            target = body['target']
+            # Per-series fleet models are selected by `store_id` and `product_id`, and pinned by `version` (latest by default).
+            key = (target, body.get('store_id'), body.get('product_id'), body.get('version'))
+            batcher = self.server.registry.get(*key)
+            horizon, exog = parse_request(body, batcher.model)
+            try:
+                future = batcher.submit(horizon, exog)
+            except Closed:
+                # Evicted between the lookup and the submit: the registry loads it again.
+                future = self.server.registry.get(*key).submit(horizon, exog)
+            pred = future.result()
+        except KeyError as e:
+            self.server.metrics.observe(time.perf_counter() - start, ok=False)
+            self._send(400, {'error': f'Missing or unknown field/target: {e}.'})
+            return
+        except LoadError as e:
+            # The model is listed but its file is missing, changed or unreadable: a server-side failure.
+            self.server.metrics.observe(time.perf_counter() - start, ok=False)
+            self._send(503, {'error': str(e)})
+            return
+        except (ValueError, TypeError) as e:
+            self.server.metrics.observe(time.perf_counter() - start, ok=False)
+            self._send(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self.server.metrics.observe(time.perf_counter() - start, ok=False)
+            self._send(500, {'error': repr(e)})
+            return
+        self.server.metrics.observe(time.perf_counter() - start)
+        self._send(200, {'target': target, 'horizon': horizon, 'forecast': pred.tolist()})
+
+    def log_message(self, format, *args):
+        # Per-request access logs would dominate the latency of warm requests.
+        pass
+
+class ForecastServer(ThreadingHTTPServer):
+    # The default listen backlog (5) resets connections as soon as a few dozen clients connect at once,
+    # before their requests ever reach the batchers.
+    daemon_threads = True
+    request_queue_size = socket.SOMAXCONN
+
+def make_server(manifest, host='127.0.0.1', port=8000, max_batch=256, max_wait=0.002, max_models=1024, root=None, backlog=None):
+    # `manifest` is a manifest dict or file (see `registry.py`). Each model is cached together with its batcher,
+    # so the batcher thread of a model ends when the model is evicted.
+    server = ForecastServer((host, port), ForecastHandler, bind_and_activate=False)
+    if backlog is not None:
+        server.request_queue_size = backlog
+    try:
+        server.server_bind()
+        server.server_activate()
+    except Exception:
+        server.server_close()
+        raise
+    server.metrics = Metrics()
+    server.registry = ModelRegistry(
+        manifest, root, max_models,
+        factory=lambda model: Batcher(model, server.metrics, max_batch, max_wait),
+        on_evict=lambda batcher: batcher.close()
+    )
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the saved SARIMAX models over HTTP.')
+    parser.add_argument('--models', default='.', help="Directory with 'model_<target>.joblib' artifacts (and their manifest).")
+    parser.add_argument('--fleet', default=None, help='Also serve the per-series models of this fleet directory (see `fleet.py`).')
+    parser.add_argument('--manifest', default=None, help='Manifest file to serve (see `registry.py`); found or built from the directories by default.')
+    parser.add_argument('--max-models', type=int, default=1024, help='Models kept loaded (least recently used ones are evicted).')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--backlog', type=int, default=None, help='Pending connections queued by the listening socket (default: the system maximum).')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help='How long a batch waits for more requests.')
+    args = parser.parse_args()
+
+    manifest = args.manifest or load_manifest(args.models, args.fleet)
+    root = None if isinstance(manifest, str) else args.models
+    server = make_server(manifest, args.host, args.port, args.max_batch, args.max_wait_ms / 1000, args.max_models, root, args.backlog)
+    print(f"Serving {server.registry.stats()['models']} models on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,142 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from artifact import load_artifact
+from scenario import scale_scenarios
+
+# Monte Carlo prediction intervals of SARIMAX forecasts.
+# Future paths are simulated from the state space form of each model, starting from a draw of the stored
+# state (mean and covariance after the last observed month), for thousands of paths of many models at once:
+# models with the same state dimension are stacked, so each step is a single batched matrix product.
+# The models work in log space, so paths are back-transformed with `expm1` before any quantile is taken:
+# this gives correct quantiles of each month and of the cumulative horizon in original units
+# (exponentiating log-space intervals, or adding up monthly quantiles, does not).
+QUANTILES = (0.1, 0.5, 0.9)
+N_PATHS = 2000
+
+def psd_sqrt(cov):
+    # Matrix square root of (a stack of) covariance matrices that may be singular (e.g. diffuse-free SARIMAX states).
+    w, v = np.linalg.eigh(cov)
+    return v * np.sqrt(np.clip(w, 0, None))[..., None, :]
+
+def system(model, steps, exog=None):
+    # State space matrices of the `steps` forecast periods of a `CompactSARIMAX`, with its fitted parameters.
+    index = pd.RangeIndex(model.nobs, model.nobs + steps)
+    if exog is not None:
+        exog = pd.DataFrame(np.asarray(exog, dtype=float).reshape(steps, -1), index=index, columns=model.exog_names)
+    mod = model.build(pd.Series(np.nan, index=index), exog)
+    mod.update(model.params.values)
+    # Attribute access keeps the time axis of every matrix (length 1 when time-invariant).
+    ssm = {name: getattr(mod.ssm, name) for name in ['design', 'obs_intercept', 'obs_cov', 'transition', 'state_intercept', 'selection', 'state_cov']}
+    for name in ['design', 'obs_cov', 'transition', 'selection', 'state_cov']:
+        if ssm[name].shape[-1] != 1:
+            raise ValueError(f'Simulation requires a time-invariant {name} matrix.')
+    at = lambda name: np.broadcast_to(ssm[name], ssm[name].shape[:-1] + (steps,))
+    return {
+        'design': ssm['design'][0, :, 0],                   # (k_states,)
+        'obs_intercept': at('obs_intercept')[0],            # (steps,): exog @ beta
+        'obs_sd': np.sqrt(ssm['obs_cov'][0, 0, 0]),
+        'transition': ssm['transition'][:, :, 0],           # (k_states, k_states)
+        'state_intercept': at('state_intercept').T,         # (steps, k_states)
+        'shock': ssm['selection'][:, :, 0] @ psd_sqrt(ssm['state_cov'][:, :, 0]),    # (k_states, k_posdef)
+        'state': np.asarray(model.artifact['state'], dtype=float),
+        'state_sqrt': psd_sqrt(np.asarray(model.artifact['state_cov'], dtype=float))
+    }
+
+def simulate_batch(systems, steps, n_paths, rng):
+    # Log-space paths (n_models, n_paths, steps) of models with the same state dimension.
+    stack = {name: np.stack([s[name] for s in systems]) for name in systems[0]}
+    n_models, k_states = stack['state'].shape
+    k_posdef = stack['shock'].shape[-1]
+
+    # Row-vector form (paths along the second axis), so every product is one batched BLAS matmul.
+    transition_t = stack['transition'].transpose(0, 2, 1)
+    shock_t = stack['shock'].transpose(0, 2, 1)
+    design = stack['design'][:, :, None]
+
+    state = stack['state'][:, None, :] + rng.standard_normal((n_models, n_paths, k_states)) @ stack['state_sqrt'].transpose(0, 2, 1)
+    paths = np.empty((n_models, n_paths, steps))
+    for t in range(steps):
+        paths[:, :, t] = (
+            (state @ design)[:, :, 0]
+            + stack['obs_intercept'][:, t, None]
+            + stack['obs_sd'][:, None] * rng.standard_normal((n_models, n_paths))
+        )
+        state = state @ transition_t + stack['state_intercept'][:, None, t, :] + rng.standard_normal((n_models, n_paths, k_posdef)) @ shock_t
+    return paths
+
+def simulate(models, steps, exog=None, n_paths=N_PATHS, scaled=False, seed=0, batch_size=256):
+    # Simulated paths in original units of every model: {key: (n_paths, steps)}.
+    # `models` is a dict of `CompactSARIMAX` (or one model); `exog` is one (steps, n_exog) array for all models
+    # or a dict of them by key, in raw units unless `scaled`.
+    models = models if isinstance(models, dict) else {None: models}
+    systems = {}
+    for key, model in models.items():
+        X = exog.get(key) if isinstance(exog, dict) else exog
+        if X is None and model.exog_names:
+            raise ValueError(f'Model {key!r} needs future exog values for {model.exog_names}.')
+        if X is not None and not scaled:
+            X = scale_scenarios(model, X)
+        systems[key] = system(model, steps, X)
+
+    # Stack models with the same state dimension (e.g. every series of a fleet target), in batches that bound memory.
+    rng = np.random.default_rng(seed)
+    groups = {}
+    for key, s in systems.items():
+        groups.setdefault((len(s['state']), s['shock'].shape[-1]), []).append(key)
+    paths = {}
+    for keys in groups.values():
+        for i in range(0, len(keys), batch_size):
+            batch = keys[i:i + batch_size]
+            log_paths = simulate_batch([systems[key] for key in batch], steps, n_paths, rng)
+            paths.update(zip(batch, np.expm1(log_paths)))
+    return {key: paths[key] for key in models}
+
+def path_quantiles(paths, quantiles=QUANTILES):
+    # Tidy frame of the mean and quantiles of each month and of the cumulative horizon up to that month.
+    rows = []
+    names = [f'p{round(q * 100)}' for q in quantiles]
+    for key, values in paths.items():
+        cumulative = values.cumsum(axis=1)
+        df_q = pd.DataFrame({
+            'key': [key] * values.shape[1],
+            'step': np.arange(1, values.shape[1] + 1),
+            'mean': values.mean(axis=0),
+            **dict(zip(names, np.quantile(values, quantiles, axis=0))),
+            'cum_mean': cumulative.mean(axis=0),
+            **dict(zip([f'cum_{n}' for n in names], np.quantile(cumulative, quantiles, axis=0)))
+        })
+        rows.append(df_q)
+    return pd.concat(rows, ignore_index=True)
+
+def forecast_intervals(models, steps, exog=None, n_paths=N_PATHS, quantiles=QUANTILES, scaled=False, seed=0):
+    return path_quantiles(simulate(models, steps, exog, n_paths, scaled, seed), quantiles)
+
+def load_fleet(fleet_dir, target):
+    # Every `model_<target>.joblib` under a fleet directory (see `fleet.py`), keyed by its series path.
+    models = {}
+    for root, _, files in os.walk(fleet_dir):
+        if f'model_{target}.joblib' in files:
+            key = os.path.relpath(root, fleet_dir)
+            models[key] = load_artifact(os.path.join(root, f'model_{target}.joblib'))
+    return dict(sorted(models.items()))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='P10/P50/P90 intervals of every fleet model by Monte Carlo simulation.')
+    parser.add_argument('--fleet', default='./fleet')
+    parser.add_argument('--target', default='net_units')
+    parser.add_argument('--steps', type=int, default=6)
+    parser.add_argument('--paths', type=int, default=N_PATHS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='./intervals.csv')
+    args = parser.parse_args()
+
+    models = load_fleet(args.fleet, args.target)
+    # Future exog at each model's training average (0 once scaled).
+    exog = {key: np.zeros((args.steps, len(model.exog_names))) for key, model in models.items()}
+    df_intervals = forecast_intervals(models, args.steps, exog, args.paths, scaled=True, seed=args.seed)
+    df_intervals.to_csv(args.out, index=False)
+    print(f'Intervals of {len(models)} models written to {args.out}.')
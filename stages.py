@@ -0,0 +1,171 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = './.stage_cache'
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Content-addressed stage cache.
+# A stage's output is stored under a hash of the stage name, its code and the content of its inputs.
+# Outputs carry the digest of their own content, so downstream stages are keyed without rehashing big inputs,
+# and a stage whose recomputed output is unchanged does not invalidate the stages after it.
+
+class Result:
+    # Output of a stage: its content digest and its value, which a cache hit only loads when it is used.
+    def __init__(self, digest, value=None, path=None):
+        self.digest = digest
+        self.path = path
+        self.loaded = path is None
+        self._value = value
+
+    @property
+    def value(self):
+        if not self.loaded:
+            self._value = joblib.load(self.path)
+            self.loaded = True
+        return self._value
+
+def feed(h, obj):
+    # Add the content of `obj` to the hash `h`.
+    if isinstance(obj, Result):
+        h.update(obj.digest.encode())
+    elif isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        schema = (obj.columns, obj.dtypes) if isinstance(obj, pd.DataFrame) else (obj.name, obj.dtype)
+        h.update(repr((type(obj).__name__, schema)).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=not isinstance(obj, pd.Index)).values.tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(repr((obj.dtype, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=repr):
+            feed(h, key)
+            feed(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f'{type(obj).__name__}{len(obj)}'.encode())
+        for item in obj:
+            feed(h, item)
+    elif isinstance(obj, bytes):
+        h.update(obj)
+    elif hasattr(obj, '__dict__') and not inspect.isroutine(obj):
+        h.update(type(obj).__qualname__.encode())
+        feed(h, vars(obj))
+    else:
+        h.update(repr(obj).encode())
+
+def fingerprint(*objs):
+    h = hashlib.sha1()
+    for obj in objs:
+        feed(h, obj)
+    return h.hexdigest()
+
+def referenced(code):
+    # Global names used by a code object, including its nested functions and comprehensions.
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= referenced(const)
+    return names
+
+def global_repr(value, seen):
+    # Deterministic representation of a module-level value a stage refers to (e.g. `cube.CUBE_KEYS`), or None for
+    # modules and runtime objects (e.g. a tracer), which are not part of the code. Project functions and classes
+    # inside values (e.g. a dict of forecasters) are represented by their code digest, others by their name.
+    if inspect.ismodule(value):
+        return None
+    if inspect.isfunction(value) or inspect.isclass(value):
+        if is_project(value):
+            return code_digest(value, seen)
+        return f'{getattr(value, "__module__", "")}.{getattr(value, "__qualname__", repr(value))}'
+    if isinstance(value, (str, bytes, int, float, complex, bool, type(None), np.generic, np.dtype)):
+        return repr(value)
+    if isinstance(value, (np.ndarray, pd.DataFrame, pd.Series, pd.Index)):
+        return fingerprint(value)
+    if isinstance(value, dict):
+        items = [(global_repr(k, seen), global_repr(v, seen)) for k, v in value.items()]
+        return repr(sorted(items, key=repr))
+    if isinstance(value, (list, tuple)):
+        return f'{type(value).__name__}{[global_repr(item, seen) for item in value]}'
+    if isinstance(value, (set, frozenset)):
+        return f'{type(value).__name__}{sorted(repr(global_repr(item, seen)) for item in value)}'
+    return None
+
+def code_digest(obj, seen=None):
+    # Source of a function or class and of every project function or class it refers to,
+    # so an edit to e.g. a helper used by a stage invalidates that stage.
+    # Module-level values it refers to (e.g. `compact.INT_TYPES`, `cube.CUBE_MEASURES`) are part of its code too.
+    seen = set() if seen is None else seen
+    if obj in seen:
+        return ''
+    seen.add(obj)
+    sources = [inspect.getsource(obj)]
+    funcs = [obj] if inspect.isfunction(obj) else [
+        getattr(member, '__func__', member) for member in vars(obj).values()
+        if inspect.isfunction(getattr(member, '__func__', member))
+    ]
+    for func in funcs:
+        for name in sorted(referenced(func.__code__)):
+            dep = func.__globals__.get(name)
+            if (inspect.isfunction(dep) or inspect.isclass(dep)) and is_project(dep):
+                sources.append(code_digest(dep, seen))
+            elif name in func.__globals__:
+                value = global_repr(dep, seen)
+                if value is not None:
+                    sources.append(f'{func.__module__}.{name} = {value}')
+    return hashlib.sha1('\n'.join(sources).encode()).hexdigest()
+
+def is_project(obj):
+    try:
+        return os.path.dirname(os.path.abspath(inspect.getfile(obj))) == PROJECT_DIR
+    except TypeError:
+        return False
+
+class StageCache:
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.log = []
+
+    def stage(self, func):
+        # Decorator: calling the stage returns a `Result`, from the cache when name, code and inputs are unchanged.
+        # Inputs can be `Result`s of other stages or plain values (both are keyed by content).
+        name = func.__name__
+        code = code_digest(func)
+
+        def run(*args, **kwargs):
+            start = time.perf_counter()
+            key = fingerprint(name, code, args, kwargs)
+            path = os.path.join(self.cache_dir, name, key)
+            if os.path.exists(path + '.json') and os.path.exists(path + '.joblib'):
+                with open(path + '.json') as f:
+                    meta = json.load(f)
+                self.log.append({'stage': name, 'status': 'hit', 'seconds': time.perf_counter() - start})
+                return Result(meta['digest'], path=path + '.joblib')
+
+            values = [arg.value if isinstance(arg, Result) else arg for arg in args]
+            kwvalues = {k: v.value if isinstance(v, Result) else v for k, v in kwargs.items()}
+            value = func(*values, **kwvalues)
+            result = Result(fingerprint(value), value)
+
+            # Write to temporary files first so an interrupted run never leaves a broken entry.
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            joblib.dump(value, path + '.joblib.tmp')
+            os.replace(path + '.joblib.tmp', path + '.joblib')
+            with open(path + '.json.tmp', 'w') as f:
+                json.dump({'stage': name, 'digest': result.digest}, f)
+            os.replace(path + '.json.tmp', path + '.json')
+            self.log.append({'stage': name, 'status': 'miss', 'seconds': time.perf_counter() - start})
+            return result
+
+        run.__name__ = name
+        run.__wrapped__ = func
+        return run
+
+    def report(self):
+        # Hits, misses and time of every stage run so far.
+        df_log = pd.DataFrame(self.log, columns=['stage', 'status', 'seconds'])
+        return df_log.groupby(['stage', 'status'], sort=False)['seconds'].agg(['count', 'sum']).reset_index()
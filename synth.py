@@ -0,0 +1,180 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ingest import DTYPES
+
+# Seeded generator of synthetic retail sales with the schema of `retail_sales_synthetic.csv`.
+# Stores, products, cities and years scale freely. The output is a Parquet dataset partitioned by
+# month (`year=YYYY/month=MM/part-NNNNN.parquet`, one part per block of stores). Each part is generated
+# and written by its own task, so the full dataset is never in memory. Every part has its own random
+# stream derived from the seed and its (year, month, block) key, so the data is identical whatever the
+# number of workers or the order the tasks finish in.
+# `ingest.read_sales` and `ingest.iter_sales` read the output directory like the CSV.
+
+CATEGORIES = ['Beauty', 'Clothing', 'Electronics', 'Home', 'Sports']
+REGIONS = ['East', 'North', 'South', 'West']
+STORE_TYPES = ['A', 'B', 'C']
+HOLIDAYS = ['01-01', '04-09', '04-10', '07-18', '07-19', '12-24', '12-25', '12-26']    # Month-day of the holidays of every year.
+DISCOUNTS = [5.0, 10.0, 15.0, 20.0, 30.0]
+
+# Rates and multiplicative effects on the expected units, close to the sample data by default.
+EFFECTS = {
+    'transactions': 0.3,      # Expected transactions per store, product and day.
+    'base_units': 4.5,        # Expected units per transaction before the effects below.
+    'season': 0.18,           # Amplitude of the 12-month seasonality (peak in `season_peak`).
+    'season_peak': 3,
+    'holiday': 0.43,          # Lift on holidays.
+    'weekend': 0.05,          # Lift on weekends.
+    'promotion': 0.20,        # Lift with a promotion.
+    'discount': 0.005,        # Lift per discount percentage point.
+    'no_discount': 0.375,     # Share of transactions without discount.
+    'promotion_rate': 0.08,
+    'online_rate': 0.25,
+    'return_rate': 0.02,      # Share of the units sold that are returned.
+    'online_returns': 0.10    # Relative increase of the return rate of online transactions.
+}
+
+def label(prefix, i, n, width):
+    return f'{prefix}_{i:0{max(width, len(str(n)))}d}'
+
+def make_stores(n_stores, n_cities, rng):
+    # Stores are spread over the cities in turn; each city lies in one region.
+    ids = np.arange(1, n_stores + 1)
+    cities = (ids - 1) % n_cities + 1
+    city_region = rng.choice(REGIONS, n_cities + 1)
+    stores = pd.DataFrame({
+        'store_id': [label('store', i, n_stores, 2) for i in ids],
+        'store_type': rng.choice(STORE_TYPES, n_stores),
+        'region': city_region[cities],
+        'city': [f'city_{c}' for c in cities],
+        'store_area_sqft': rng.integers(15, 31, n_stores) * 100
+    })
+    return stores
+
+def make_products(n_products, rng):
+    ids = np.arange(1, n_products + 1)
+    products = pd.DataFrame({
+        'product_id': [label('prod', i, n_products, 3) for i in ids],
+        'category': rng.choice(CATEGORIES, n_products),
+        'base_price': rng.uniform(10, 120, n_products).round(2)
+    })
+    return products
+
+def generate_part(stores, products, year, month, seed, block, effects=EFFECTS):
+    # Transactions of a block of stores in one month.
+    rng = np.random.default_rng([seed, year, month, block])
+    days = pd.date_range(f'{year}-{month:02d}-01', periods=pd.Period(f'{year}-{month:02d}').days_in_month, freq='D')
+    n_stores, n_products = len(stores), len(products)
+
+    # Number of transactions of every (day, store), then a product for each of them.
+    counts = rng.poisson(effects['transactions'] * n_products, size=len(days) * n_stores)
+    day = np.repeat(np.repeat(np.arange(len(days)), n_stores), counts)
+    store = np.repeat(np.tile(np.arange(n_stores), len(days)), counts)
+    product = rng.integers(0, n_products, len(day))
+    n = len(day)
+
+    # Calendar flags are computed per day and then looked up for every transaction.
+    dates = days[day]
+    day_of_week = days.dayofweek.to_numpy()[day]
+    weekend = (day_of_week >= 5).astype('int8')
+    is_holiday = days.strftime('%m-%d').isin(HOLIDAYS).astype('int8')[day]
+    promotion = (rng.random(n) < effects['promotion_rate']).astype('int8')
+    online = (rng.random(n) < effects['online_rate']).astype('int8')
+    discount_pct = np.where(rng.random(n) < effects['no_discount'], 0.0, rng.choice(DISCOUNTS, n))
+
+    season = 1 + effects['season'] * np.cos(2 * np.pi * (month - effects['season_peak']) / 12)
+    lam = (
+        effects['base_units'] * season
+        * (1 + effects['holiday'] * is_holiday)
+        * (1 + effects['weekend'] * weekend)
+        * (1 + effects['promotion'] * promotion)
+        * (1 + effects['discount'] * discount_pct)
+    )
+    units_sold = rng.poisson(lam)
+    returns = rng.binomial(units_sold, effects['return_rate'] * (1 + effects['online_returns'] * online))
+    net_units = units_sold - returns
+
+    base_price = products['base_price'].to_numpy()[product]
+    final_price = (base_price * (1 - discount_pct / 100)).round(2)
+    df = pd.DataFrame({
+        'date': dates,
+        **{col: stores[col].to_numpy()[store] for col in ['store_id', 'store_type', 'region', 'city', 'store_area_sqft']},
+        'product_id': products['product_id'].to_numpy()[product],
+        'category': products['category'].to_numpy()[product],
+        'base_price': base_price,
+        'final_price': final_price,
+        'discount_pct': discount_pct,
+        'promotion': promotion,
+        'is_holiday': is_holiday,
+        'day_of_week': day_of_week,
+        'weekend': weekend,
+        'units_sold': units_sold,
+        'returns': returns,
+        'net_units': net_units,
+        'revenue': (units_sold * final_price).round(2),
+        'net_revenue': (net_units * final_price).round(2),
+        'avg_rating': rng.uniform(2, 5, n).round(2),
+        'online': online
+    })
+    # Plain strings in the files (categories differ between parts); the readers restore the categorical dtypes.
+    return df.astype({col: dtype for col, dtype in DTYPES.items() if dtype != 'category'})
+
+def write_part(out_dir, stores, products, year, month, seed, block, effects=EFFECTS):
+    df = generate_part(stores, products, year, month, seed, block, effects)
+    part_dir = os.path.join(out_dir, f'year={year}', f'month={month:02d}')
+    os.makedirs(part_dir, exist_ok=True)
+    path = os.path.join(part_dir, f'part-{block:05d}.parquet')
+    # Write to a temporary file first so an interrupted run never leaves a broken part.
+    df.to_parquet(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+    return len(df)
+
+def generate(out_dir, n_stores=10, n_products=50, n_cities=10, start_year=2022, n_years=3, seed=0,
+             stores_per_part=100, n_jobs=None, effects=EFFECTS):
+    rng = np.random.default_rng(seed)
+    stores = make_stores(n_stores, min(n_cities, n_stores), rng)
+    products = make_products(n_products, rng)
+    blocks = [stores.iloc[i:i + stores_per_part] for i in range(0, n_stores, stores_per_part)]
+    tasks = [(year, month, block) for year in range(start_year, start_year + n_years) for month in range(1, 13) for block in range(len(blocks))]
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(tasks))
+    if n_jobs == 1:
+        n_rows = sum(write_part(out_dir, blocks[b], products, y, m, seed, b, effects) for y, m, b in tasks)
+    else:
+        # Spawned workers, as in `fleet.py`; each task only receives its block of stores and the products.
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=mp.get_context('spawn')) as pool:
+            futures = [pool.submit(write_part, out_dir, blocks[b], products, y, m, seed, b, effects) for y, m, b in tasks]
+            n_rows = sum(future.result() for future in futures)
+
+    meta = {
+        'seed': seed, 'stores': n_stores, 'products': n_products, 'cities': min(n_cities, n_stores),
+        'start_year': start_year, 'years': n_years, 'stores_per_part': stores_per_part,
+        'effects': effects, 'rows': int(n_rows), 'parts': len(tasks)
+    }
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    return meta
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a reproducible synthetic retail sales dataset as partitioned Parquet.')
+    parser.add_argument('--out', default='./data/synthetic')
+    parser.add_argument('--stores', type=int, default=10)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--cities', type=int, default=10)
+    parser.add_argument('--start-year', type=int, default=2022)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stores-per-part', type=int, default=100, help='Stores per Parquet part (bounds the memory of a task).')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes (default: all cores).')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    meta = generate(args.out, args.stores, args.products, args.cities, args.start_year, args.years, args.seed, args.stores_per_part, args.jobs)
+    print(f"Wrote {meta['rows']:,} rows in {meta['parts']} parts to {args.out} in {time.perf_counter() - start:.1f}s.")